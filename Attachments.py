@@ -0,0 +1,169 @@
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+
+# Anything an image can be passed as: a file path, raw bytes, or an object with
+# getvalue() or read() such as Streamlit's UploadedFile
+ImageSource = Union[str, bytes, bytearray, memoryview, object]
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+@dataclass(frozen=True)
+class Attachment:
+    """
+    An image ready to be embedded in a message.
+    """
+    filename: str
+    data: bytes
+    subtype: str
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+
+def image_subtype(data: bytes, filename: str = "") -> str:
+    """
+    Image MIME subtype from the file signature, falling back to the file name.
+    """
+    for signature, subtype in _SIGNATURES:
+        if data.startswith(signature):
+            return subtype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    guessed, _ = mimetypes.guess_type(filename)
+    if guessed and guessed.startswith("image/"):
+        return guessed.split("/", 1)[1]
+    raise ValueError(f"Could not determine the image type of {filename or 'attachment'}")
+
+
+def load_attachment(source: ImageSource, index: int = 0) -> Attachment:
+    """
+    Read an image from a path, an in-memory buffer or an uploaded file.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+        filename = os.path.basename(source)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        filename = f"image_{index}"
+    else:
+        data = bytes(source.getvalue() if hasattr(source, "getvalue") else source.read())
+        filename = os.path.basename(getattr(source, "name", "") or f"image_{index}")
+
+    subtype = image_subtype(data, filename)
+    if "." not in filename:
+        filename = f"{filename}.{'jpg' if subtype == 'jpeg' else subtype}"
+    return Attachment(filename, data, subtype)
+
+
+class ImageOptimizer:
+    """
+    Downscales and recompresses photos that exceed a size budget.
+
+    Uses Pillow when it is installed; without it images are sent unchanged.
+    Images already within the budget are never touched.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024, max_dimension: int = 1920,
+                 qualities: Sequence[int] = (85, 75, 65, 55)):
+        """
+        Args:
+            max_bytes: Target size of each attachment
+            max_dimension: Longest side, in pixels, of recompressed images
+            qualities: JPEG qualities tried in order until the image fits
+        """
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.qualities = qualities
+        self.logger = logging.getLogger('ImageOptimizer')
+
+    def optimize(self, attachment: Attachment) -> Attachment:
+        if len(attachment.data) <= self.max_bytes or attachment.subtype == "gif":
+            return attachment
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            self.logger.warning("Pillow is not installed, sending images unchanged (pip install pillow)")
+            return attachment
+
+        with Image.open(io.BytesIO(attachment.data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                # JPEG has no alpha channel, so flatten onto white
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            dimension = self.max_dimension
+            while True:
+                image.thumbnail((dimension, dimension), Image.LANCZOS)
+                for quality in self.qualities:
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+                    if buffer.tell() <= self.max_bytes:
+                        break
+                if buffer.tell() <= self.max_bytes or dimension <= 320:
+                    break
+                dimension = int(dimension * 0.75)
+
+        data = buffer.getvalue()
+        if len(data) >= len(attachment.data):
+            return attachment
+        self.logger.info(f"Recompressed {attachment.filename}: {len(attachment.data)} -> {len(data)} bytes")
+        filename = os.path.splitext(attachment.filename)[0] + ".jpg"
+        return Attachment(filename, data, "jpeg")
+
+
+class AttachmentPipeline:
+    """
+    Turns image sources into Attachments, optimizing each distinct image once.
+
+    Results are cached by content hash, so a campaign sent in several batches
+    (or re-sent after a retry) only decodes and recompresses its images once.
+    """
+
+    def __init__(self, optimizer: Optional[ImageOptimizer] = None, max_entries: int = 64):
+        """
+        Args:
+            optimizer: Applied to every image (None sends images unchanged)
+            max_entries: Processed images kept in the LRU cache
+        """
+        self.optimizer = optimizer
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._processed: "OrderedDict[Tuple[str, str], Attachment]" = OrderedDict()
+
+    def prepare(self, images: Optional[Sequence[ImageSource]]) -> List[Attachment]:
+        return [self._process(load_attachment(image, i)) for i, image in enumerate(images or [])]
+
+    def _process(self, attachment: Attachment) -> Attachment:
+        if self.optimizer is None:
+            return attachment
+        key = (attachment.digest, attachment.filename)
+        with self._lock:
+            if key in self._processed:
+                self._processed.move_to_end(key)
+                return self._processed[key]
+
+        processed = self.optimizer.optimize(attachment)
+        with self._lock:
+            self._processed[key] = processed
+            while len(self._processed) > self.max_entries:
+                self._processed.popitem(last=False)
+        return processed
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from TagCache import TagCache
+
+
+@dataclass
+class AudienceQuery:
+    """
+    Everything that determines the audience of an event.
+    """
+    event_prompt: str
+    sem_from: int
+    sem_to: int
+    vocabulary_version: str
+    branch: Optional[Union[str, Sequence[str]]] = None
+    section: Optional[Union[str, Sequence[str]]] = None
+    required_tags: Optional[Sequence[str]] = None
+    limit: Optional[int] = None
+
+    def key(self) -> Tuple:
+        prompt_hash = hashlib.sha256(TagCache.normalize(self.event_prompt).encode("utf-8")).hexdigest()
+        return (
+            prompt_hash,
+            int(self.sem_from),
+            int(self.sem_to),
+            self.vocabulary_version,
+            _freeze(self.branch),
+            _freeze(self.section),
+            _freeze(self.required_tags),
+            self.limit
+        )
+
+    def covers(self, record: dict) -> bool:
+        """
+        Whether a student record could belong to this audience.
+        """
+        if not int(self.sem_from) <= int(record["sem"]) <= int(self.sem_to):
+            return False
+        for field_name, allowed in (("branch", self.branch), ("section", self.section)):
+            if allowed and record.get(field_name) not in ((allowed,) if isinstance(allowed, str) else allowed):
+                return False
+        return True
+
+
+def _record_ids(records: Sequence[dict]) -> set:
+    return {record['_id'] for record in records if '_id' in record}
+
+
+def _freeze(value) -> Optional[Union[str, Tuple[str, ...]]]:
+    if value is None or isinstance(value, str):
+        return value
+    return tuple(sorted(value))
+
+
+class AudienceCache:
+    """
+    In-process LRU cache of event audiences.
+
+    Entries are invalidated incrementally: when a student is added or changed,
+    only the cached audiences whose filters could include that student, or
+    that already contain the student's record, are dropped. A TTL bounds
+    staleness from writes made by other processes.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = 15 * 60):
+        """
+        Args:
+            max_entries: Maximum number of cached audiences before LRU eviction
+            ttl_seconds: Age after which an audience is recomputed (None disables expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[AudienceQuery, List[dict], float]]" = OrderedDict()
+
+    def get(self, query: AudienceQuery) -> Optional[List[dict]]:
+        key = query.key()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            _, audience, created = entry
+            if self.ttl_seconds is not None and time.time() - created > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(audience)
+
+    def put(self, query: AudienceQuery, audience: List[dict]) -> None:
+        with self._lock:
+            self._entries[query.key()] = (query, list(audience), time.time())
+            self._entries.move_to_end(query.key())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, records: Sequence[dict]) -> int:
+        """
+        Drop the cached audiences that any of the given student records could
+        belong to, or that contain a record with the same _id (a
+        re-registration may have moved the student out of the audience).
+        Returns the number of entries dropped.
+        """
+        ids = _record_ids(records)
+        with self._lock:
+            stale = [
+                key for key, (query, audience, _) in self._entries.items()
+                if any(query.covers(record) for record in records)
+                or (ids and any(hit.get('_id') in ids for hit in audience))
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries)
+        }
+
+
+class SharedAudienceCache:
+    """
+    SQLite-backed AudienceCache that several worker processes can share.
+
+    Same interface and invalidation rules as AudienceCache, but entries live
+    in a file, so an audience computed by one process is reused by the
+    others and a registration handled by one process invalidates the
+    audiences cached by all of them.
+    """
+
+    def __init__(self, path: str = "audience_cache.sqlite3", max_entries: int = 1024,
+                 ttl_seconds: Optional[float] = 15 * 60):
+        """
+        Args:
+            path: SQLite database file shared by the processes
+            max_entries: Maximum number of cached audiences before LRU eviction
+            ttl_seconds: Age after which an audience is recomputed (None disables expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS audiences (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                sem_from INTEGER NOT NULL,
+                sem_to INTEGER NOT NULL,
+                audience TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS audiences_accessed ON audiences (accessed)")
+        # Which records each cached audience contains, to invalidate by _id
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS audience_members (key TEXT NOT NULL, record_id TEXT NOT NULL, "
+            "PRIMARY KEY (record_id, key))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(query: AudienceQuery) -> str:
+        return hashlib.sha256(json.dumps(query.key()).encode("utf-8")).hexdigest()
+
+    def get(self, query: AudienceQuery) -> Optional[List[dict]]:
+        key = self._key(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT audience, created FROM audiences WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._delete([key])
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE audiences SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _delete(self, keys: Sequence[str]) -> None:
+        self._conn.executemany("DELETE FROM audiences WHERE key = ?", [(key,) for key in keys])
+        self._conn.executemany("DELETE FROM audience_members WHERE key = ?", [(key,) for key in keys])
+
+    def put(self, query: AudienceQuery, audience: List[dict]) -> None:
+        now = time.time()
+        key = self._key(query)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO audiences (key, query, sem_from, sem_to, audience, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(asdict(query)), int(query.sem_from), int(query.sem_to),
+                 json.dumps(audience), now, now)
+            )
+            self._conn.execute("DELETE FROM audience_members WHERE key = ?", (key,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO audience_members (key, record_id) VALUES (?, ?)",
+                [(key, hit['_id']) for hit in audience if '_id' in hit]
+            )
+            evicted = self._conn.execute(
+                "SELECT key FROM audiences ORDER BY accessed DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            ).fetchall()
+            self._delete([row[0] for row in evicted])
+            self._conn.commit()
+
+    def invalidate(self, records: Sequence[dict]) -> int:
+        """
+        Drop the cached audiences that any of the given student records could
+        belong to, or that contain a record with the same _id. Returns the
+        number of entries dropped.
+        """
+        semesters = sorted({int(record["sem"]) for record in records})
+        if not semesters:
+            return 0
+        ids = sorted(_record_ids(records))
+        with self._lock:
+            # The semester range narrows the candidates in SQL; branch and
+            # section are checked by AudienceQuery.covers
+            candidates = self._conn.execute(
+                "SELECT key, query FROM audiences WHERE sem_from <= ? AND sem_to >= ?",
+                (semesters[-1], semesters[0])
+            ).fetchall()
+            stale = {
+                key for key, query in candidates
+                if any(AudienceQuery(**json.loads(query)).covers(record) for record in records)
+            }
+            for record_id in ids:
+                stale.update(row[0] for row in self._conn.execute(
+                    "SELECT key FROM audience_members WHERE record_id = ?", (record_id,)
+                ))
+            self._delete(sorted(stale))
+            self._conn.commit()
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM audiences")
+            self._conn.execute("DELETE FROM audience_members")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM audiences").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": size
+        }
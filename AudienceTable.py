@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class AudienceTable:
+    """
+    Compact columnar view of an event audience.
+
+    Holds one array per column instead of a list of nested hit dicts, so it is
+    cheap to keep in Streamlit session state, and serves sorted pages so only
+    the visible rows are sent to the browser.
+    """
+
+    def __init__(self, hits: Sequence[dict]):
+        """
+        Args:
+            hits: Ranked hits from compare_embeddings
+        """
+        self.columns: Dict[str, np.ndarray] = {
+            "username": np.array([hit['fields'].get('username', "") for hit in hits], dtype=object),
+            "email": np.array([hit['fields'].get('email', "") for hit in hits], dtype=object),
+            "branch": np.array([hit['fields'].get('branch', "") for hit in hits], dtype=object),
+            "sem": np.array([hit['fields'].get('sem', 0) for hit in hits], dtype=np.int16),
+            "section": np.array([hit['fields'].get('section', "") for hit in hits], dtype=object),
+            "score": np.array([hit.get('final_score', hit['_score']) for hit in hits], dtype=np.float32)
+        }
+        self._orders: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns["email"])
+
+    @property
+    def emails(self) -> List[str]:
+        return self.columns["email"].tolist()
+
+    def merge_fields(self) -> Dict[str, dict]:
+        """
+        Per-recipient template values for NotificationHandler / DeliveryQueue.
+        """
+        names = ("username", "branch", "sem", "section")
+        rows = zip(*(self.columns[name].tolist() for name in names))
+        return {email: dict(zip(names, row)) for email, row in zip(self.emails, rows)}
+
+    def page_count(self, page_size: int) -> int:
+        return max(1, -(-len(self) // page_size))
+
+    def page(self, page: int, page_size: int = 50, sort_by: str = "score",
+             descending: Optional[bool] = None) -> Dict[str, list]:
+        """
+        One page of rows as {column: values}, sorted by the given column.
+
+        Args:
+            page: Zero-based page number
+            page_size: Rows per page
+            sort_by: Column to sort by
+            descending: Sort order (defaults to descending for score, ascending otherwise)
+        """
+        if descending is None:
+            descending = sort_by == "score"
+        order = self._order(sort_by)
+        start = page * page_size
+        if descending:
+            rows = order[::-1][start:start + page_size]
+        else:
+            rows = order[start:start + page_size]
+        return {name: column[rows].tolist() for name, column in self.columns.items()}
+
+    def _order(self, sort_by: str) -> np.ndarray:
+        # Sort orders are computed once per column and reused across reruns
+        if sort_by not in self._orders:
+            column = self.columns[sort_by]
+            keys = column.astype(str) if column.dtype == object else column
+            self._orders[sort_by] = np.argsort(keys, kind="stable")
+        return self._orders[sort_by]
@@ -0,0 +1,10 @@
+import random
+
+
+def backoff_delay(backoff_seconds: float, attempt: int) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based): exponential
+    backoff with jitter between half and one and a half times the base, so
+    concurrent retries spread out instead of hitting the server together.
+    """
+    return backoff_seconds * (2 ** attempt) * (0.5 + random.random())
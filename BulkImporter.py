@@ -0,0 +1,282 @@
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from Backoff import backoff_delay
+from LLMScheduler import BACKGROUND, llm_priority
+from PineConeHandler import PineConeHandler
+
+# Pinecone accepts at most 96 records per upsert when it embeds the text itself
+MAX_UPSERT_BATCH = 96
+
+REQUIRED_COLUMNS = ("user_prompt", "email", "username", "sem", "section", "branch")
+
+
+@dataclass
+class ImportReport:
+    """
+    Summary of a bulk import run.
+    """
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    failed_rows: List[int] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+class ImportCheckpoint:
+    """
+    SQLite record of rows that were upserted successfully, so an interrupted
+    import can resume without re-sending them.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.source = source
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS imported_rows (source TEXT NOT NULL, row_number INTEGER NOT NULL, "
+            "PRIMARY KEY (source, row_number))"
+        )
+        self._conn.commit()
+
+    def completed(self) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_number FROM imported_rows WHERE source = ?", (self.source,)
+            ).fetchall()
+        return {row_number for (row_number,) in rows}
+
+    def mark(self, row_numbers: Iterable[int]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO imported_rows (source, row_number) VALUES (?, ?)",
+                [(self.source, row_number) for row_number in row_numbers]
+            )
+            self._conn.commit()
+
+
+def read_rows(path: str) -> Iterator[Dict[str, str]]:
+    """
+    Stream student rows from a CSV or Parquet file without loading it whole.
+    """
+    if path.lower().endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet files requires pyarrow (pip install pyarrow)") from e
+
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+class BulkImporter:
+    """
+    Imports many students at once: tags are classified per batch, records are
+    upserted in chunks of at most MAX_UPSERT_BATCH, and several batches run
+    concurrently on a bounded worker pool with retry and exponential backoff.
+    """
+
+    def __init__(self,
+                 handler: PineConeHandler,
+                 batch_size: int = MAX_UPSERT_BATCH,
+                 workers: int = 4,
+                 max_retries: int = 5,
+                 backoff_seconds: float = 1.0,
+                 checkpoint: Optional[ImportCheckpoint] = None,
+                 progress_every: int = 10):
+        """
+        Args:
+            handler: Handler used for tag classification and upserts
+            batch_size: Records per upsert (capped at MAX_UPSERT_BATCH)
+            workers: Number of batches processed concurrently
+            max_retries: Classification and upsert attempts per batch before its rows count as failed
+            backoff_seconds: Base delay of the exponential backoff between attempts
+            checkpoint: Progress store used to skip rows imported by an earlier run
+            progress_every: Log throughput after this many completed batches
+        """
+        self.handler = handler
+        self.batch_size = max(1, min(batch_size, MAX_UPSERT_BATCH))
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.checkpoint = checkpoint
+        self.progress_every = progress_every
+        self.logger = logging.getLogger('BulkImporter')
+
+    def _batches(self, rows: Iterable[Dict[str, str]], done: Set[int],
+                 report: ImportReport) -> Iterator[List[Tuple[int, Dict[str, str]]]]:
+        batch = []
+        for row_number, row in enumerate(rows):
+            if row_number in done:
+                report.skipped += 1
+                continue
+            # Bad rows are reported on their own so they cannot fail the rest of their batch
+            try:
+                row = self._validate_row(row)
+            except ValueError as e:
+                report.failed += 1
+                report.failed_rows.append(row_number)
+                self.logger.error(f"Row {row_number} skipped: {e}")
+                continue
+            batch.append((row_number, row))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _validate_row(row: Dict[str, str]) -> Dict[str, str]:
+        """
+        Check one row's columns and convert its semester, raising ValueError
+        when the row cannot be imported.
+        """
+        missing = [column for column in REQUIRED_COLUMNS if row.get(column) in (None, "")]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        try:
+            sem = int(row["sem"])
+        except (TypeError, ValueError):
+            raise ValueError(f"sem must be an integer, got {row['sem']!r}") from None
+        return {**row, "sem": sem, "mobile_no": row.get("mobile_no") or ""}
+
+    def _process_batch(self, batch: List[Tuple[int, Dict[str, str]]]) -> List[int]:
+        rows = [row for _, row in batch]
+        prompts = [row["user_prompt"] for row in rows]
+
+        def classify():
+            with llm_priority(BACKGROUND):
+                return self.handler.classifier.classify_batch(prompts)
+
+        # Unlike handler.generate_tags_batch, a failed classification fails the
+        # batch instead of storing the rows without tags
+        tags = self._with_retries("Classification", classify)
+        records = [
+            self.handler.build_record(
+                user_prompt=row["user_prompt"],
+                email=row["email"],
+                mobile_no=row["mobile_no"],
+                username=row["username"],
+                sem=row["sem"],
+                section=row["section"],
+                branch=row["branch"],
+                tags=row_tags
+            )
+            for row, row_tags in zip(rows, tags)
+        ]
+        # Rows for the same email share an id; keep the last one in the batch
+        records = list({record["_id"]: record for record in records}.values())
+
+        self._with_retries("Upsert", lambda: self.handler.upsert_records(records))
+
+        row_numbers = [row_number for row_number, _ in batch]
+        if self.checkpoint is not None:
+            self.checkpoint.mark(row_numbers)
+        return row_numbers
+
+    def _with_retries(self, action: str, func):
+        for attempt in range(self.max_retries):
+            try:
+                return func()
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = backoff_delay(self.backoff_seconds, attempt)
+                self.logger.warning(f"{action} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, rows: Iterable[Dict[str, str]]) -> ImportReport:
+        """
+        Import an iterable of rows with the REQUIRED_COLUMNS (mobile_no is optional).
+
+        Returns:
+            ImportReport with counts, elapsed time and the row numbers that failed
+        """
+        report = ImportReport()
+        done = self.checkpoint.completed() if self.checkpoint is not None else set()
+        started = time.perf_counter()
+        batches_done = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for batch in self._batches(rows, done, report):
+                # Keep at most two batches per worker in flight so large files stream
+                if len(pending) >= self.workers * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    batches_done += self._collect(finished, pending, report)
+                    self._log_progress(report, started, batches_done)
+                pending[pool.submit(self._process_batch, batch)] = batch
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                batches_done += self._collect(finished, pending, report)
+                self._log_progress(report, started, batches_done)
+
+        report.elapsed = time.perf_counter() - started
+        self.logger.info(
+            f"Imported {report.imported} students ({report.skipped} skipped, {report.failed} failed) "
+            f"in {report.elapsed:.1f}s, {report.throughput:.1f} rows/s"
+        )
+        return report
+
+    def _collect(self, finished, pending, report: ImportReport) -> int:
+        for future in finished:
+            batch = pending.pop(future)
+            try:
+                report.imported += len(future.result())
+            except Exception as e:
+                row_numbers = [row_number for row_number, _ in batch]
+                report.failed += len(row_numbers)
+                report.failed_rows.extend(row_numbers)
+                self.logger.error(f"Batch starting at row {row_numbers[0]} failed: {e}")
+        return len(finished)
+
+    def _log_progress(self, report: ImportReport, started: float, batches_done: int) -> None:
+        if batches_done % self.progress_every == 0:
+            elapsed = time.perf_counter() - started
+            self.logger.info(f"{report.imported} students imported, {report.imported / elapsed:.1f} rows/s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import students from a CSV or Parquet file")
+    parser.add_argument("path", help="CSV or Parquet file with columns: " + ", ".join(REQUIRED_COLUMNS) + ", mobile_no")
+    parser.add_argument("--index", required=True, help="Pinecone index name")
+    parser.add_argument("--classifier", default="llm_fallback", choices=["llm", "local", "llm_fallback"])
+    parser.add_argument("--batch-size", type=int, default=MAX_UPSERT_BATCH)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--checkpoint", default="import_checkpoint.sqlite3",
+                        help="SQLite file recording imported rows, used to resume")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    handler = PineConeHandler(index_name=args.index, classifier=args.classifier)
+    importer = BulkImporter(
+        handler,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_retries=args.max_retries,
+        checkpoint=ImportCheckpoint(args.checkpoint, source=os.path.abspath(args.path))
+    )
+    report = importer.run(read_rows(args.path))
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from NotificationHandler import NotificationHandler
+
+
+class DeliveryQueue:
+    """
+    Durable SQLite-backed queue of email campaigns.
+
+    Every recipient of a campaign has its own delivery record, so a worker that
+    crashes mid-campaign resumes with only the recipients that were not sent.
+    Enqueueing the same campaign twice (e.g. after a page reload) is a no-op.
+    Workers claim recipients with a lease before sending, so any number of
+    workers can drain the same file without sending a recipient twice.
+    """
+
+    def __init__(self, path: str = "delivery_queue.sqlite3", spool_dir: Optional[str] = None,
+                 max_attempts: int = 3, retry_delay: float = 60.0, lease_seconds: float = 900.0):
+        """
+        Args:
+            path: SQLite database file
+            spool_dir: Directory where uploaded images are stored until sent
+                       (defaults to '<path>.spool')
+            max_attempts: Send attempts per recipient before it is marked as failed
+            retry_delay: Seconds before a failed recipient is attempted again
+            lease_seconds: Seconds a worker owns the recipients it claimed; claims
+                           of workers that died are released after this
+        """
+        self.path = path
+        self.spool_dir = spool_dir or f"{path}.spool"
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.wakeup = threading.Event()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS campaigns (
+                id TEXT PRIMARY KEY,
+                subject TEXT NOT NULL,
+                text_content TEXT NOT NULL,
+                urls TEXT NOT NULL,
+                images TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                campaign_id TEXT NOT NULL REFERENCES campaigns (id),
+                recipient TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                fields TEXT,
+                owner TEXT,
+                lease_until REAL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (campaign_id, recipient)
+            );
+            CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (status, campaign_id);
+            """
+        )
+        # Queues created before per-recipient merge fields and leases existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(deliveries)")}
+        for column, column_type in (("fields", "TEXT"), ("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE deliveries ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    def enqueue(self,
+                recipients: List[str],
+                subject: str,
+                text_content: str,
+                urls: Optional[List[Dict[str, str]]] = None,
+                images: Optional[list] = None,
+                campaign_id: Optional[str] = None,
+                merge_fields: Optional[Dict[str, dict]] = None) -> str:
+        """
+        Queue a campaign for background delivery.
+
+        Args:
+            recipients: List of recipient email addresses
+            subject: Email subject
+            text_content: Main text content
+            urls: List of dicts with 'url' and 'text' keys
+            images: Image file paths, bytes/memoryview buffers or uploaded file
+                    objects (anything with getvalue() or read() and a name)
+            campaign_id: Idempotency key; derived from the campaign content if omitted
+            merge_fields: Per-recipient template values (username, branch, sem, ...)
+
+        Returns:
+            The campaign id, used to poll progress
+        """
+        urls = urls or []
+        images = images or []
+        merge_fields = merge_fields or {}
+        image_data = [self._image_bytes(image) for image in images]
+        if campaign_id is None:
+            digest = hashlib.sha256()
+            for part in (subject, text_content, json.dumps(urls, sort_keys=True), *sorted(recipients)):
+                digest.update(part.encode("utf-8") + b"\0")
+            for name, data in image_data:
+                digest.update(name.encode("utf-8") + b"\0" + hashlib.sha256(data).digest())
+            campaign_id = digest.hexdigest()[:32]
+
+        image_paths = self._spool_images(campaign_id, image_data)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO campaigns (id, subject, text_content, urls, images, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (campaign_id, subject, text_content, json.dumps(urls), json.dumps(image_paths), now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (campaign_id, recipient, fields, updated) VALUES (?, ?, ?, ?)",
+                [
+                    (campaign_id, recipient, json.dumps(merge_fields[recipient]) if recipient in merge_fields else None, now)
+                    for recipient in dict.fromkeys(recipients)
+                ]
+            )
+            self._conn.commit()
+
+        self.wakeup.set()
+        return campaign_id
+
+    @staticmethod
+    def _image_bytes(image) -> tuple:
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                return os.path.basename(image), f.read()
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return "image", bytes(image)
+        data = image.getvalue() if hasattr(image, "getvalue") else image.read()
+        return os.path.basename(getattr(image, "name", "image")), bytes(data)
+
+    def _spool_images(self, campaign_id: str, image_data: list) -> List[str]:
+        campaign_dir = os.path.join(self.spool_dir, campaign_id)
+        paths = []
+        for i, (name, data) in enumerate(image_data):
+            path = os.path.join(campaign_dir, f"{i}_{name}")
+            if not os.path.exists(path):
+                os.makedirs(campaign_dir, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            paths.append(path)
+        return paths
+
+    def next_batch(self, limit: int = 200, owner: str = "") -> Optional[tuple]:
+        """
+        Claim up to `limit` due recipients of the oldest campaign that has any
+        and return (campaign, recipients), or None when there is nothing to send.
+        The campaign's 'merge_fields' holds the template values of those recipients.
+
+        Claimed recipients are marked 'sending' under `owner` until
+        lease_seconds from now; other workers skip them, and record() only
+        accepts failures from the owner. Expired leases go back to pending.
+        """
+        now = time.time()
+        retry_before = now - self.retry_delay
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot
+            # select the same pending rows before either has claimed them
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE deliveries SET owner = NULL, lease_until = NULL, attempts = attempts + 1, "
+                    "error = 'lease expired', updated = ?, "
+                    "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+                    "WHERE status = 'sending' AND lease_until < ?",
+                    (now, self.max_attempts, now)
+                )
+                row = self._conn.execute(
+                    "SELECT c.id, c.subject, c.text_content, c.urls, c.images FROM campaigns c "
+                    "WHERE EXISTS (SELECT 1 FROM deliveries d WHERE d.campaign_id = c.id AND d.status = 'pending' "
+                    "AND (d.attempts = 0 OR d.updated <= ?)) ORDER BY c.created LIMIT 1",
+                    (retry_before,)
+                ).fetchone()
+                if row is None:
+                    self._conn.commit()
+                    return None
+
+                campaign = {
+                    "id": row[0],
+                    "subject": row[1],
+                    "text_content": row[2],
+                    "urls": json.loads(row[3]),
+                    "images": json.loads(row[4])
+                }
+                rows = self._conn.execute(
+                    "SELECT recipient, fields FROM deliveries WHERE campaign_id = ? AND status = 'pending' "
+                    "AND (attempts = 0 OR updated <= ?) LIMIT ?",
+                    (campaign["id"], retry_before, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE deliveries SET status = 'sending', owner = ?, lease_until = ? "
+                    "WHERE campaign_id = ? AND recipient = ?",
+                    [(owner, now + self.lease_seconds, campaign["id"], recipient) for recipient, _ in rows]
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        recipients = [recipient for recipient, _ in rows]
+        campaign["merge_fields"] = {recipient: json.loads(fields) for recipient, fields in rows if fields}
+        return campaign, recipients
+
+    def record(self, campaign_id: str, recipient: str, success: bool, error: Optional[str] = None,
+               owner: str = "") -> None:
+        """
+        Record the outcome of one delivery attempt.
+
+        A successful send is always recorded; a failure is ignored unless the
+        recipient is still claimed by `owner` (its lease may have expired and
+        been taken over by another worker).
+        """
+        with self._lock:
+            if success:
+                self._conn.execute(
+                    "UPDATE deliveries SET status = 'sent', attempts = attempts + 1, error = NULL, owner = NULL, "
+                    "lease_until = NULL, updated = ? WHERE campaign_id = ? AND recipient = ?",
+                    (time.time(), campaign_id, recipient)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE deliveries SET attempts = attempts + 1, error = ?, updated = ?, owner = NULL, "
+                    "lease_until = NULL, status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+                    "WHERE campaign_id = ? AND recipient = ? AND status = 'sending' AND owner = ?",
+                    (error, time.time(), self.max_attempts, campaign_id, recipient, owner)
+                )
+            self._conn.commit()
+
+    def release_spool(self, campaign_id: str) -> bool:
+        """
+        Delete a campaign's spooled images once none of its recipients is
+        pending or being sent. Returns True when the spool was removed.
+        """
+        with self._lock:
+            (unfinished,) = self._conn.execute(
+                "SELECT COUNT(*) FROM deliveries WHERE campaign_id = ? AND status IN ('pending', 'sending')",
+                (campaign_id,)
+            ).fetchone()
+        if unfinished:
+            return False
+        shutil.rmtree(os.path.join(self.spool_dir, campaign_id), ignore_errors=True)
+        return True
+
+    def progress(self, campaign_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM deliveries WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+            ).fetchall()
+        counts = {"pending": 0, "sent": 0, "failed": 0}
+        counts.update(dict(rows))
+        # Recipients being sent right now are still pending to the caller
+        counts["pending"] += counts.pop("sending", 0)
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def results(self, campaign_id: str) -> Dict[str, bool]:
+        """
+        Dict mapping finished recipients to success status (True/False).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT recipient, status FROM deliveries WHERE campaign_id = ? AND status IN ('sent', 'failed')",
+                (campaign_id,)
+            ).fetchall()
+        return {recipient: status == "sent" for recipient, status in rows}
+
+
+class DeliveryWorker(threading.Thread):
+    """
+    Background thread that drains a DeliveryQueue through NotificationHandler.
+    """
+
+    def __init__(self, delivery_queue: DeliveryQueue, notification_handler: NotificationHandler,
+                 batch_size: int = 200, poll_interval: float = 5.0, **send_options):
+        """
+        Args:
+            delivery_queue: Queue to drain
+            notification_handler: Handler used to send the emails
+            batch_size: Recipients handed to send_bulk_email at a time
+            poll_interval: Seconds to sleep when the queue is empty
+            send_options: Extra keyword arguments for send_bulk_email (concurrency, rate_limit, ...)
+        """
+        super().__init__(name="DeliveryWorker", daemon=True)
+        self.queue = delivery_queue
+        self.notification_handler = notification_handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.send_options = send_options
+        self.logger = logging.getLogger('DeliveryWorker')
+        # Identifies this worker's claims in the queue
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.queue.wakeup.set()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                drained = not self.process_once()
+            except Exception as e:
+                self.logger.error(f"Delivery queue error: {str(e)}")
+                drained = True
+
+            if drained:
+                self.queue.wakeup.wait(self.poll_interval)
+                self.queue.wakeup.clear()
+
+    def process_once(self) -> bool:
+        """
+        Send one batch of due recipients. Returns False when nothing was due.
+        """
+        batch = self.queue.next_batch(self.batch_size, self.owner)
+        if batch is None:
+            return False
+
+        campaign, recipients = batch
+        try:
+            self.notification_handler.send_bulk_email(
+                recipients=recipients,
+                subject=campaign["subject"],
+                text_content=campaign["text_content"],
+                urls=campaign["urls"],
+                images=campaign["images"],
+                merge_fields=campaign["merge_fields"],
+                on_result=lambda recipient, success: self.queue.record(
+                    campaign["id"], recipient, success, None if success else "send failed", self.owner
+                ),
+                **self.send_options
+            )
+        except Exception as e:
+            # The message could not be built, or the SMTP server rejected the
+            # login or stayed unreachable; count it as one attempt for every
+            # unsent recipient so a broken campaign cannot block the queue forever
+            self.logger.error(f"Campaign {campaign['id']} failed: {str(e)}")
+            for recipient in recipients:
+                self.queue.record(campaign["id"], recipient, False, str(e), self.owner)
+        self.queue.release_spool(campaign["id"])
+        return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a standalone email delivery worker")
+    parser.add_argument("--db", default="delivery_queue.sqlite3", help="Delivery queue SQLite file")
+    parser.add_argument("--provider", default=os.getenv("SMTP_PROVIDER", "gmail"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    notification_handler = NotificationHandler(
+        email=os.getenv("SMTP_EMAIL", ""),
+        password=os.getenv("SMTP_PASSWORD", ""),
+        provider=args.provider
+    )
+    worker = DeliveryWorker(DeliveryQueue(args.db), notification_handler, concurrency=args.concurrency)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(1)
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
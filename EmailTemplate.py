@@ -0,0 +1,97 @@
+import base64
+import html
+import re
+import uuid
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# {{ field }} or {{ field | fallback }}
+_PLACEHOLDER = re.compile(r"\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(?:\|\s*([^}]*?)\s*)?\}\}")
+
+
+class EmailTemplate:
+    """
+    Text template with {{ field }} and {{ field | fallback }} placeholders.
+
+    The source is parsed once into literal chunks and slots; render() only
+    joins them. Values are HTML-escaped. A placeholder whose field is missing
+    renders its fallback, or is left as written when it has none, so braces
+    in event descriptions survive.
+    """
+
+    def __init__(self, source: str, escape: bool = True):
+        """
+        Args:
+            source: Template text
+            escape: HTML-escape substituted values
+        """
+        self.source = source
+        self.escape = escape
+        self._parts: List[str] = []
+        self._slots: List[Tuple[int, str, Optional[str], str]] = []
+
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            self._parts.append(source[position:match.start()])
+            self._slots.append((len(self._parts), match.group(1), match.group(2), match.group(0)))
+            self._parts.append("")
+            position = match.end()
+        self._parts.append(source[position:])
+
+    @property
+    def fields(self) -> List[str]:
+        return [name for _, name, _, _ in self._slots]
+
+    def render(self, values: Optional[Mapping[str, object]] = None) -> str:
+        if not self._slots:
+            return self._parts[0]
+        values = values or {}
+        parts = list(self._parts)
+        for index, name, fallback, original in self._slots:
+            value = values.get(name)
+            if value is None or value == "":
+                parts[index] = original if fallback is None else fallback
+            else:
+                parts[index] = html.escape(str(value)) if self.escape else str(value)
+        return "".join(parts)
+
+
+class MessageTemplate:
+    """
+    A serialized MIME message whose HTML body is rendered per recipient.
+
+    The message is built once with a marker in place of the HTML part's
+    base64 payload. Rendering for a recipient fills the HTML template,
+    base64-encodes it into the gap and prepends the To header.
+    """
+
+    def __init__(self, message, html_part, body: EmailTemplate, policy):
+        """
+        Args:
+            message: The complete MIME message, without a To header
+            html_part: The base64-encoded text/html part inside message
+            body: Template for the HTML body
+            policy: email.policy used to serialize the message
+        """
+        marker = f"BODY{uuid.uuid4().hex}"
+        html_part.set_payload(marker)
+        serialized = message.as_bytes(policy=policy)
+        self.prefix, self.suffix = serialized.split(marker.encode("ascii"), 1)
+        self.body = body
+        self.policy = policy
+        self.linesep = policy.linesep.encode("ascii")
+        # Without merge fields every recipient gets the same bytes
+        self._static_body = None if body.fields else self._encode(body.render())
+
+    def _encode(self, html_body: str) -> bytes:
+        encoded = base64.encodebytes(html_body.encode("utf-8")).rstrip(b"\n")
+        return encoded.replace(b"\n", self.linesep)
+
+    def render(self, recipient: str, fields: Optional[Dict[str, object]] = None) -> bytes:
+        body = self._static_body if self._static_body is not None else self._encode(self.body.render(fields))
+        # Headers come first in the serialized message, so prepending one is valid
+        if recipient.isascii():
+            to = f"To: {recipient}".encode("ascii") + self.linesep
+        else:
+            # Display names with non-ASCII characters are RFC 2047 encoded
+            to = self.policy.fold("To", self.policy.header_factory("To", recipient)).encode("ascii")
+        return to + self.prefix + body + self.suffix
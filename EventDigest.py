@@ -0,0 +1,133 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from DeliveryQueue import DeliveryQueue
+from Metrics import METRICS
+from PineConeHandler import PineConeHandler
+
+
+@dataclass
+class DigestEvent:
+    """
+    One event in a digest batch.
+    """
+    name: str
+    description: str
+    sem_from: int = 1
+    sem_to: int = 8
+    url: Optional[str] = None
+    details: str = ""
+    branch: Optional[List[str]] = None
+    section: Optional[List[str]] = None
+    required_tags: Optional[List[str]] = None
+
+    def match_arguments(self) -> dict:
+        return {
+            "event_prompt": self.description,
+            "sem_from": self.sem_from,
+            "sem_to": self.sem_to,
+            "branch": self.branch,
+            "section": self.section,
+            "required_tags": self.required_tags
+        }
+
+
+@dataclass
+class StudentDigest:
+    """
+    The events one student matched, as (event index, final_score) pairs in
+    batch order.
+    """
+    email: str
+    fields: dict
+    events: List[Tuple[int, float]] = field(default_factory=list)
+
+
+class EventDigest:
+    """
+    Matches a batch of events at once and mails each student a single email
+    listing every event they matched, instead of one email per event.
+    """
+
+    def __init__(self, handler: PineConeHandler, max_events_per_student: Optional[int] = None):
+        """
+        Args:
+            handler: Handler used to match the events
+            max_events_per_student: Keep only a student's best-scoring events
+        """
+        self.handler = handler
+        self.max_events_per_student = max_events_per_student
+
+    def match(self, events: Sequence[DigestEvent]) -> List[StudentDigest]:
+        """
+        Match all events in one pass and invert the audiences per student.
+        """
+        audiences = self.handler.match_events([event.match_arguments() for event in events])
+
+        digests: Dict[str, StudentDigest] = {}
+        for index, audience in enumerate(audiences):
+            for hit in audience:
+                email = hit['fields'].get('email')
+                if not email:
+                    continue
+                key = PineConeHandler.normalize_email(email)
+                if key not in digests:
+                    digests[key] = StudentDigest(email, hit['fields'])
+                digests[key].events.append((index, hit['final_score']))
+
+        for digest in digests.values():
+            if self.max_events_per_student is not None and len(digest.events) > self.max_events_per_student:
+                best = sorted(digest.events, key=lambda event: event[1], reverse=True)[:self.max_events_per_student]
+                digest.events = sorted(best)
+        METRICS.incr("digest.matches", sum(len(audience) for audience in audiences))
+        METRICS.incr("digest.students", len(digests))
+        return list(digests.values())
+
+    @staticmethod
+    def compose(events: Sequence[DigestEvent], indexes: Sequence[int]) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Text content and registration links of a digest listing the given events.
+        """
+        lines = ["Here are the upcoming events that match your interests:"]
+        urls = []
+        for number, index in enumerate(indexes, start=1):
+            event = events[index]
+            lines += ["", f"{number}. {event.name}"]
+            if event.details:
+                lines.append(event.details)
+            lines.append(event.description)
+            if event.url:
+                urls.append({'url': event.url, 'text': f"Register: {event.name}"})
+        return "\n".join(lines), urls
+
+    def enqueue(self, delivery_queue: DeliveryQueue, events: Sequence[DigestEvent],
+                digests: Sequence[StudentDigest], subject: str = "Events picked for you") -> List[str]:
+        """
+        Queue one email per student.
+
+        Students who matched the same set of events share a campaign, so each
+        distinct digest is built once and only the merge fields (username,
+        branch, sem, section) differ per recipient.
+
+        Returns:
+            The campaign ids, used to poll progress
+        """
+        groups: Dict[Tuple[int, ...], List[StudentDigest]] = defaultdict(list)
+        for digest in digests:
+            groups[tuple(index for index, _ in digest.events)].append(digest)
+
+        campaign_ids = []
+        for indexes, members in groups.items():
+            text_content, urls = self.compose(events, indexes)
+            campaign_ids.append(delivery_queue.enqueue(
+                recipients=[digest.email for digest in members],
+                subject=subject,
+                text_content=text_content,
+                urls=urls,
+                merge_fields={
+                    digest.email: {key: digest.fields.get(key) for key in ("username", "branch", "sem", "section")}
+                    for digest in members
+                }
+            ))
+        return campaign_ids
@@ -0,0 +1,113 @@
+import asyncio
+import base64
+from typing import Dict, List, Optional, Union
+
+import requests
+
+from Attachments import load_attachment
+
+
+class EventsClient:
+    """
+    Thin HTTP client for EventsService.
+
+    Mirrors the parts of PineConeHandler and DeliveryQueue the app uses, so
+    the Streamlit UI can run against a remote service unchanged.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        """
+        Args:
+            base_url: Service address, e.g. http://events-service:8080
+            timeout: Seconds to wait for each request
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _get(self, path: str) -> dict:
+        response = self.session.get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path: str, payload: dict) -> dict:
+        response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        if response.status_code == 400:
+            raise ValueError(response.json().get("error", response.text))
+        response.raise_for_status()
+        return response.json()
+
+    @property
+    def readiness(self) -> Dict[str, str]:
+        try:
+            return self._get("/health")["components"]
+        except requests.RequestException as e:
+            return {"service": f"failed: {e}"}
+
+    @property
+    def is_ready(self) -> bool:
+        return all(status == "ready" for status in self.readiness.values())
+
+    def stats(self) -> dict:
+        return self._get("/stats")
+
+    def save_students(self, students: List[dict]) -> int:
+        return self._post("/students", {"students": students})["saved"]
+
+    def save_embdeddings(self, user_prompt: str, email: str, mobile_no: str, username: str, sem, section: str,
+                         branch: str):
+        self.save_students([{
+            "user_prompt": user_prompt, "email": email, "mobile_no": mobile_no, "username": username,
+            "sem": sem, "section": section, "branch": branch
+        }])
+        return "User Date is Uploaded"
+
+    async def asave_embdeddings(self, **kwargs):
+        return await asyncio.to_thread(self.save_embdeddings, **kwargs)
+
+    def match_events(self, events: List[dict]) -> List[List[dict]]:
+        return self._post("/match", {"events": events})["audiences"]
+
+    def compare_embeddings(self, event_prompt: str, sem_to, sem_from,
+                           branch: Optional[Union[str, List[str]]] = None,
+                           section: Optional[Union[str, List[str]]] = None,
+                           required_tags: Optional[List[str]] = None,
+                           limit: Optional[int] = None) -> List[dict]:
+        return self.match_events([{
+            "event_prompt": event_prompt, "sem_from": sem_from, "sem_to": sem_to, "branch": branch,
+            "section": section, "required_tags": required_tags, "limit": limit
+        }])[0]
+
+    async def acompare_embeddings(self, **kwargs) -> List[dict]:
+        return await asyncio.to_thread(self.compare_embeddings, **kwargs)
+
+    def enqueue(self,
+                recipients: List[str],
+                subject: str,
+                text_content: str,
+                urls: Optional[List[Dict[str, str]]] = None,
+                images: Optional[list] = None,
+                campaign_id: Optional[str] = None,
+                merge_fields: Optional[Dict[str, dict]] = None) -> str:
+        images_payload = []
+        for i, image in enumerate(images or []):
+            attachment = load_attachment(image, i)
+            images_payload.append({"name": attachment.filename, "data": base64.b64encode(attachment.data).decode("ascii")})
+        return self._post("/campaigns", {"campaigns": [{
+            "recipients": recipients,
+            "subject": subject,
+            "text_content": text_content,
+            "urls": urls,
+            "images": images_payload,
+            "campaign_id": campaign_id,
+            "merge_fields": merge_fields
+        }]})["campaign_ids"][0]
+
+    def _campaign(self, campaign_id: str) -> dict:
+        return self._get(f"/campaigns/{campaign_id}")
+
+    def progress(self, campaign_id: str) -> Dict[str, int]:
+        return self._campaign(campaign_id)["progress"]
+
+    def results(self, campaign_id: str) -> Dict[str, bool]:
+        return self._campaign(campaign_id)["results"]
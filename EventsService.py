@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import functools
+import io
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Union
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.process
+import tornado.web
+
+from AudienceCache import SharedAudienceCache
+from DeliveryQueue import DeliveryQueue, DeliveryWorker
+from Metrics import METRICS
+from NotificationHandler import NotificationHandler
+from PineConeHandler import PineConeHandler
+
+# Largest number of students or events accepted by one batch request
+MAX_BATCH = 1000
+
+CAMPAIGN_ID = re.compile(r"[0-9a-zA-Z_-]+")
+
+
+class ServiceError(tornado.web.HTTPError):
+    """
+    A client error reported as an HTTP 400 response.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(400, message)
+
+
+class JSONHandler(tornado.web.RequestHandler):
+    """
+    Base handler: JSON request bodies and responses, errors as {'error': ...}.
+    """
+
+    def initialize(self, pinecone_handler: PineConeHandler, delivery_queue: DeliveryQueue):
+        self.pinecone_handler = pinecone_handler
+        self.delivery_queue = delivery_queue
+
+    def body(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError as e:
+            raise ServiceError(f"Invalid JSON: {e}") from e
+        if not isinstance(body, dict):
+            raise ServiceError("Expected a JSON object")
+        return body
+
+    def batch(self, body: dict, name: str) -> List[dict]:
+        items = body.get(name)
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ServiceError(f"'{name}' must be a list of objects")
+        if len(items) > MAX_BATCH:
+            raise ServiceError(f"At most {MAX_BATCH} {name} per request")
+        return items
+
+    @staticmethod
+    def integer(item: dict, name: str, optional: bool = False) -> Optional[int]:
+        value = item.get(name)
+        if value is None and optional:
+            return None
+        try:
+            if isinstance(value, bool):
+                raise TypeError(name)
+            return int(value)
+        except (TypeError, ValueError) as e:
+            raise ServiceError(f"'{name}' must be an integer") from e
+
+    @staticmethod
+    def string(item: dict, name: str, optional: bool = False) -> Optional[str]:
+        value = item.get(name)
+        if value is None and optional:
+            return None
+        if not isinstance(value, str):
+            raise ServiceError(f"'{name}' must be a string")
+        return value
+
+    @staticmethod
+    def string_list(item: dict, name: str, optional: bool = True) -> Optional[List[str]]:
+        value = item.get(name)
+        if value is None and optional:
+            return None
+        if not isinstance(value, list) or not all(isinstance(entry, str) for entry in value):
+            raise ServiceError(f"'{name}' must be a list of strings")
+        return value
+
+    def strings(self, item: dict, name: str) -> Optional[Union[str, List[str]]]:
+        """
+        An optional filter given as one string or a list of strings.
+        """
+        if isinstance(item.get(name), str):
+            return item[name]
+        try:
+            return self.string_list(item, name)
+        except ServiceError as e:
+            raise ServiceError(f"'{name}' must be a string or a list of strings") from e
+
+    @staticmethod
+    async def blocking(func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def write_json(self, data) -> None:
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(data))
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        error = kwargs.get("exc_info", (None, None))[1]
+        message = error.log_message if isinstance(error, tornado.web.HTTPError) and error.log_message else self._reason
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"error": message}))
+
+
+class HealthHandler(JSONHandler):
+    def get(self):
+        self.write_json({
+            "ready": self.pinecone_handler.is_ready,
+            "components": self.pinecone_handler.readiness
+        })
+
+
+class StatsHandler(JSONHandler):
+    def get(self):
+        self.write_json(self.pinecone_handler.stats())
+
+
+class PrometheusHandler(JSONHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.finish(METRICS.prometheus_text())
+
+
+class StudentsHandler(JSONHandler):
+    async def post(self):
+        students = [
+            {
+                "user_prompt": self.string(student, "user_prompt"),
+                "email": self.string(student, "email"),
+                "mobile_no": self.string(student, "mobile_no", optional=True) or "",
+                "username": self.string(student, "username"),
+                "sem": self.integer(student, "sem"),
+                "section": self.string(student, "section"),
+                "branch": self.string(student, "branch")
+            }
+            for student in self.batch(self.body(), "students")
+        ]
+        saved = await self.pinecone_handler.asave_students(students) if students else 0
+        self.write_json({"saved": saved})
+
+
+class MatchHandler(JSONHandler):
+    async def post(self):
+        events = [
+            {
+                "event_prompt": self.string(event, "event_prompt"),
+                "sem_from": self.integer(event, "sem_from"),
+                "sem_to": self.integer(event, "sem_to"),
+                "branch": self.strings(event, "branch"),
+                "section": self.strings(event, "section"),
+                "required_tags": self.string_list(event, "required_tags"),
+                "limit": self.integer(event, "limit", optional=True)
+            }
+            for event in self.batch(self.body(), "events")
+        ]
+        audiences = await self.pinecone_handler.amatch_events(events) if events else []
+        self.write_json({"audiences": audiences})
+
+
+class CampaignsHandler(JSONHandler):
+    async def post(self):
+        # Validate every campaign before queueing any of them
+        campaigns = [
+            {
+                "recipients": self.string_list(campaign, "recipients", optional=False),
+                "subject": self.string(campaign, "subject"),
+                "text_content": self.string(campaign, "text_content", optional=True) or "",
+                "urls": self._urls(campaign),
+                "images": self._images(campaign),
+                "campaign_id": self._campaign_id(campaign),
+                "merge_fields": self._merge_fields(campaign)
+            }
+            for campaign in self.batch(self.body(), "campaigns")
+        ]
+        campaign_ids = []
+        for campaign in campaigns:
+            campaign_ids.append(await self.blocking(self.delivery_queue.enqueue, **campaign))
+        self.write_json({"campaign_ids": campaign_ids})
+
+    @staticmethod
+    def _urls(campaign: dict) -> Optional[List[Dict[str, str]]]:
+        urls = campaign.get("urls")
+        if urls is None:
+            return None
+        if not isinstance(urls, list) or not all(
+            isinstance(url, dict) and isinstance(url.get("url"), str) and isinstance(url.get("text", ""), str)
+            for url in urls
+        ):
+            raise ServiceError("'urls' must be a list of {'url': ..., 'text': ...} objects")
+        return [{"url": url["url"], "text": url.get("text", "")} for url in urls]
+
+    def _images(self, campaign: dict) -> List[io.BytesIO]:
+        images = campaign.get("images") or []
+        if not isinstance(images, list):
+            raise ServiceError("'images' must be a list")
+        return [self._decode_image(image) for image in images]
+
+    @staticmethod
+    def _campaign_id(campaign: dict) -> Optional[str]:
+        campaign_id = campaign.get("campaign_id")
+        # Used as a spool directory name, so only the characters the status route accepts
+        if campaign_id is not None and not (isinstance(campaign_id, str) and CAMPAIGN_ID.fullmatch(campaign_id)):
+            raise ServiceError("'campaign_id' must contain only letters, digits, '_' and '-'")
+        return campaign_id
+
+    @staticmethod
+    def _merge_fields(campaign: dict) -> Optional[Dict[str, dict]]:
+        merge_fields = campaign.get("merge_fields")
+        if merge_fields is not None and not (
+            isinstance(merge_fields, dict) and all(isinstance(fields, dict) for fields in merge_fields.values())
+        ):
+            raise ServiceError("'merge_fields' must map recipients to objects")
+        return merge_fields
+
+    @staticmethod
+    def _decode_image(image: dict) -> io.BytesIO:
+        try:
+            buffer = io.BytesIO(base64.b64decode(image["data"], validate=True))
+            name = image.get("name", "image")
+            if not isinstance(name, str):
+                raise TypeError(name)
+        except (KeyError, TypeError, AttributeError, binascii.Error) as e:
+            raise ServiceError("Images must be {'name': ..., 'data': <base64>}") from e
+        buffer.name = name
+        return buffer
+
+
+class CampaignHandler(JSONHandler):
+    async def get(self, campaign_id: str):
+        progress = await self.blocking(self.delivery_queue.progress, campaign_id)
+        if not progress["total"]:
+            raise tornado.web.HTTPError(404, "Unknown campaign")
+        results = await self.blocking(self.delivery_queue.results, campaign_id)
+        self.write_json({"progress": progress, "results": results})
+
+
+def make_app(pinecone_handler: PineConeHandler, delivery_queue: DeliveryQueue) -> tornado.web.Application:
+    """
+    HTTP API over registration, matching and email delivery.
+
+    The process keeps no state of its own: student records live in the vector
+    store, tags and audiences in the SQLite caches (see TAG_CACHE_PATH and
+    AUDIENCE_CACHE_PATH) and campaigns in the delivery queue, so several
+    service processes can share them (see --processes).
+
+    This scales across the cores of one host only. The caches and the queue
+    are SQLite files on local disk: a second host would have its own queue
+    (campaign status requests routed there answer 404) and would not see
+    the other host's cache invalidations.
+    """
+    services = {"pinecone_handler": pinecone_handler, "delivery_queue": delivery_queue}
+    return tornado.web.Application([
+        (r"/health", HealthHandler, services),
+        (r"/stats", StatsHandler, services),
+        (r"/metrics", PrometheusHandler, services),
+        (r"/students", StudentsHandler, services),
+        (r"/match", MatchHandler, services),
+        (r"/campaigns", CampaignsHandler, services),
+        (r"/campaigns/(" + CAMPAIGN_ID.pattern + ")", CampaignHandler, services),
+    ])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the event matching and notification HTTP service")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes sharing the port and the SQLite files on this host (0 = one per CPU)")
+    parser.add_argument("--index", default=os.getenv("PINECONE_INDEX", ""), help="Pinecone index name")
+    parser.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "pinecone"), choices=["pinecone", "local"])
+    parser.add_argument("--classifier", default="llm_fallback", choices=["llm", "local", "llm_fallback"])
+    parser.add_argument("--queue", default="delivery_queue.sqlite3", help="Delivery queue SQLite file")
+    parser.add_argument("--deliver", action="store_true",
+                        help="Also send queued emails from each process (otherwise run python -m DeliveryQueue)")
+    args = parser.parse_args(argv)
+    if args.processes != 1 and args.backend == "local":
+        # Each process would keep its own row map over the same store files
+        parser.error("--backend local can only be served by a single process")
+
+    logging.basicConfig(level=logging.INFO)
+    sockets = tornado.netutil.bind_sockets(args.port)
+    if args.processes != 1:
+        tornado.process.fork_processes(args.processes)
+
+    async def serve():
+        # Clients and SQLite connections are created after forking, per process
+        audience_cache = None
+        if args.processes != 1 and not os.getenv("AUDIENCE_CACHE_PATH"):
+            # Forked processes must see each other's invalidations
+            audience_cache = SharedAudienceCache(
+                os.path.join(os.path.dirname(os.path.abspath(args.queue)), "audience_cache.sqlite3")
+            )
+        pinecone_handler = PineConeHandler(index_name=args.index, classifier=args.classifier,
+                                           backend=args.backend, audience_cache=audience_cache, lazy=True)
+        pinecone_handler.warm_up_in_background()
+        delivery_queue = DeliveryQueue(args.queue)
+        if args.deliver:
+            DeliveryWorker(delivery_queue, NotificationHandler(
+                email=os.getenv("SMTP_EMAIL", ""),
+                password=os.getenv("SMTP_PASSWORD", ""),
+                provider=os.getenv("SMTP_PROVIDER", "gmail")
+            )).start()
+
+        server = tornado.httpserver.HTTPServer(make_app(pinecone_handler, delivery_queue))
+        server.add_sockets(sockets)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from TagClassifier import TAGS
+
+
+class TagEncoder:
+    """
+    Encodes tag lists as bitsets over a fixed vocabulary, one uint64 word per
+    64 tags, so set operations become vectorized bitwise operations.
+    """
+
+    def __init__(self, vocabulary: Sequence[str] = TAGS):
+        self.vocabulary = list(vocabulary)
+        self.index: Dict[str, int] = {tag: i for i, tag in enumerate(self.vocabulary)}
+        self.words = max(1, (len(self.vocabulary) + 63) // 64)
+
+    def encode(self, tags: Sequence[str]) -> np.ndarray:
+        return self.encode_many([tags])[0]
+
+    def encode_many(self, tag_lists: Sequence[Sequence[str]]) -> np.ndarray:
+        """
+        Returns:
+            uint64 array of shape (len(tag_lists), words); unknown tags are ignored
+        """
+        positions = [[self.index[tag] for tag in tags if tag in self.index] for tags in tag_lists]
+        lengths = np.fromiter((len(p) for p in positions), dtype=np.int64, count=len(positions))
+        bits = np.fromiter((i for p in positions for i in p), dtype=np.int64, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(positions)), lengths)
+
+        encoded = np.zeros((len(positions), self.words), dtype=np.uint64)
+        np.bitwise_or.at(encoded, (rows, bits >> 6), np.left_shift(np.uint64(1), (bits & 63).astype(np.uint64)))
+        return encoded
+
+
+class HybridRanker:
+    """
+    Batch scorer for search hits: final = semantic_weight * vector score
+    + tag_weight * Jaccard(student tags, event tags). Hits below the threshold
+    are dropped and the rest are returned sorted by final score.
+    """
+
+    def __init__(self, vocabulary: Sequence[str] = TAGS, semantic_weight: float = 0.7,
+                 tag_weight: float = 0.3, threshold: float = 0.6):
+        """
+        Args:
+            vocabulary: Tag vocabulary the bitsets are built over
+            semantic_weight: Weight of the vector similarity score
+            tag_weight: Weight of the tag Jaccard similarity
+            threshold: Minimum final score for a student to be kept
+        """
+        self.encoder = TagEncoder(vocabulary)
+        self.semantic_weight = semantic_weight
+        self.tag_weight = tag_weight
+        self.threshold = threshold
+
+    def can_pass(self, semantic_score: float) -> bool:
+        """
+        Whether a hit with this vector score could pass with a perfect tag match.
+        """
+        return self.semantic_weight * semantic_score + self.tag_weight >= self.threshold
+
+    def jaccard(self, candidates: np.ndarray, query: np.ndarray) -> np.ndarray:
+        intersection = np.bitwise_count(candidates & query).sum(axis=1, dtype=np.int64)
+        union = np.bitwise_count(candidates | query).sum(axis=1, dtype=np.int64)
+        similarity = np.divide(intersection, union, out=np.zeros(len(candidates)), where=union > 0)
+        return np.round(similarity, 3)
+
+    def score(self, hits: Sequence[dict], query_tags: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (final scores, Jaccard similarities) for every hit, in hit order
+        """
+        if not hits:
+            return np.zeros(0), np.zeros(0)
+
+        semantic = np.fromiter((hit['_score'] for hit in hits), dtype=np.float64, count=len(hits))
+        candidates = self.encoder.encode_many([hit['fields'].get('tags', []) for hit in hits])
+        similarity = self.jaccard(candidates, self.encoder.encode(query_tags))
+        return self.semantic_weight * semantic + self.tag_weight * similarity, similarity
+
+    def rank(self, hits: Sequence[dict], query_tags: Sequence[str]) -> List[dict]:
+        """
+        Score, threshold and sort hits. Each kept hit gains 'final_score' and
+        'tag_similarity' keys.
+        """
+        final_scores, similarity = self.score(hits, query_tags)
+        keep = np.flatnonzero(final_scores >= self.threshold)
+        order = keep[np.argsort(-final_scores[keep], kind="stable")]
+
+        ranked = []
+        for i in order:
+            hit = hits[i]
+            hit['final_score'] = float(final_scores[i])
+            hit['tag_similarity'] = float(similarity[i])
+            ranked.append(hit)
+        return ranked
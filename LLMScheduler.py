@@ -0,0 +1,177 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, List, Optional
+
+from Backoff import backoff_delay
+from Metrics import METRICS
+from RateLimiter import RateLimiter
+
+# Lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_PRIORITY = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+# Provider errors worth retrying after a backoff (matched by class name so the
+# SDK does not have to be imported here)
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError"}
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """
+    Run LLM calls made inside the block at the given priority, e.g.
+    `with llm_priority(BACKGROUND):` around registrations and imports.
+    """
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class LLMScheduler:
+    """
+    Shared scheduler for LLM requests.
+
+    - Identical requests that are already queued or running share one call
+      (single-flight), so a burst of the same prompt costs one request.
+    - A token bucket keeps the request rate within the provider's quota.
+    - At most max_concurrency requests are in flight at a time.
+    - Interactive requests (event matching) are served before background
+      ones (registrations, bulk imports).
+    - Rate-limit and transient provider errors are retried with backoff
+      instead of failing straight to the fallback classifier.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None, max_concurrency: int = 4,
+                 max_retries: int = 3, backoff_seconds: float = 1.0):
+        """
+        Args:
+            rate: Requests per second allowed by the quota (None disables limiting)
+            burst: Requests that may be sent back to back (defaults to max(1, rate))
+            max_concurrency: Requests in flight at once
+            max_retries: Attempts per request on rate-limit and transient errors
+            backoff_seconds: Base delay of the exponential backoff between attempts
+        """
+        self.limiter = RateLimiter(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue: List[tuple] = []
+        self._in_flight: Dict[Hashable, Future] = {}
+        # (priority, sequence) of the live queue entry of each waiting request
+        self._queued: Dict[Hashable, tuple] = {}
+        self._sequence = itertools.count()
+        self._workers: List[threading.Thread] = []
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        """
+        Build a scheduler from GEMINI_REQUESTS_PER_MINUTE and GEMINI_MAX_CONCURRENCY.
+        """
+        per_minute = os.getenv('GEMINI_REQUESTS_PER_MINUTE')
+        return cls(
+            rate=float(per_minute) / 60 if per_minute else None,
+            max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+        )
+
+    def submit(self, key: Hashable, func: Callable[[], object], priority: Optional[int] = None) -> Future:
+        """
+        Schedule func() and return a Future for its result. Requests with the
+        same key that are still pending share the same Future.
+
+        Args:
+            key: Identity of the request, e.g. (model name, prompt)
+            func: The blocking call to make
+            priority: INTERACTIVE or BACKGROUND (defaults to the llm_priority context)
+        """
+        priority = _PRIORITY.get() if priority is None else priority
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                METRICS.incr("llm.coalesced")
+                if key in self._queued and priority < self._queued[key][0]:
+                    # An interactive caller joined a queued background request:
+                    # queue it again at the higher priority, the old entry is skipped
+                    entry = next(entry for entry in self._queue if entry[:2] == self._queued[key])
+                    self._queued[key] = (priority, next(self._sequence))
+                    heapq.heappush(self._queue, (*self._queued[key], *entry[2:]))
+                    self._ready.notify()
+                return future
+
+            future = Future()
+            self._in_flight[key] = future
+            self._queued[key] = (priority, next(self._sequence))
+            heapq.heappush(self._queue, (*self._queued[key], time.perf_counter(), key, func, future))
+            if len(self._workers) < self.max_concurrency:
+                worker = threading.Thread(target=self._work, name=f"LLMScheduler-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._ready.notify()
+        return future
+
+    def call(self, key: Hashable, func: Callable[[], object], priority: Optional[int] = None,
+             timeout: Optional[float] = None):
+        """
+        Blocking version of submit: returns func's result or raises its error.
+        """
+        return self.submit(key, func, priority).result(timeout)
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._ready.wait()
+
+            # Take a token before picking the task, so a request that arrives
+            # while we wait for quota can still jump ahead if it is interactive
+            self.limiter.acquire()
+            with self._lock:
+                entry = None
+                while self._queue:
+                    entry = heapq.heappop(self._queue)
+                    if self._queued.get(entry[3]) == entry[:2]:
+                        break
+                    # Superseded by a higher-priority copy of the same request
+                    entry = None
+                if entry is None:
+                    continue
+                _, _, queued, key, func, future = entry
+                del self._queued[key]
+            METRICS.observe("llm.queue_wait", time.perf_counter() - queued)
+
+            try:
+                result = self._run(func)
+            except BaseException as e:
+                with self._lock:
+                    del self._in_flight[key]
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    del self._in_flight[key]
+                future.set_result(result)
+
+    def _run(self, func: Callable[[], object]):
+        for attempt in range(self.max_retries):
+            try:
+                return func()
+            except Exception as e:
+                if type(e).__name__ not in RETRYABLE_ERRORS or attempt == self.max_retries - 1:
+                    raise
+                METRICS.incr("llm.retries")
+                time.sleep(backoff_delay(self.backoff_seconds, attempt))
+                self.limiter.acquire()
+
+
+# Process-wide scheduler shared by every Gemini classifier
+LLM_SCHEDULER = LLMScheduler.from_env()
@@ -0,0 +1,175 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List
+
+
+class MetricsSink:
+    """
+    Receives every measurement as it is recorded. Subclass and register with
+    Metrics.add_sink to forward measurements elsewhere.
+    """
+
+    def record(self, kind: str, name: str, value: float) -> None:
+        raise NotImplementedError
+
+
+class LoggingSink(MetricsSink):
+    """
+    Logs each span and counter increment.
+    """
+
+    def __init__(self, level: int = logging.DEBUG):
+        self.level = level
+        self.logger = logging.getLogger('Metrics')
+
+    def record(self, kind: str, name: str, value: float) -> None:
+        if kind == "timing":
+            self.logger.log(self.level, f"{name} took {value * 1000:.1f}ms")
+        else:
+            self.logger.log(self.level, f"{name} += {value:g}")
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and timing spans.
+
+    Timings keep a sliding window of recent samples for percentiles, plus
+    lifetime count and sum.
+    """
+
+    def __init__(self, window: int = 1024):
+        """
+        Args:
+            window: Number of recent samples kept per timing for percentiles
+        """
+        self.window = window
+        self._counters: Dict[str, float] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, List[float]] = {}
+        self._sinks: List[MetricsSink] = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink: MetricsSink) -> None:
+        self._sinks.append(sink)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        for sink in self._sinks:
+            sink.record("counter", name, value)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            samples.append(seconds)
+            self._totals[name][0] += 1
+            self._totals[name][1] += seconds
+        for sink in self._sinks:
+            sink.record("timing", name, seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time a block of code; exceptions also increment '<name>.errors'.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.incr(f"{name}.errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Returns:
+            {'counters': {name: value}, 'timings': {name: {count, mean_ms, p50_ms, p95_ms, max_ms}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            totals = {name: tuple(total) for name, total in self._totals.items()}
+
+        timings = {}
+        for name, values in samples.items():
+            count, total = totals[name]
+            timings[name] = {
+                "count": count,
+                "mean_ms": total / count * 1000,
+                "p50_ms": _percentile(values, 0.50) * 1000,
+                "p95_ms": _percentile(values, 0.95) * 1000,
+                "max_ms": values[-1] * 1000
+            }
+        return {"counters": counters, "timings": timings}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+            self._totals.clear()
+
+    def prometheus_text(self, prefix: str = "events_agent") -> str:
+        """
+        Render the registry in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+        for name, timing in sorted(snapshot["timings"].items()):
+            metric = f"{prefix}_{_metric_name(name)}_seconds"
+            lines += [
+                f"# TYPE {metric} summary",
+                f'{metric}{{quantile="0.5"}} {timing["p50_ms"] / 1000:.6f}',
+                f'{metric}{{quantile="0.95"}} {timing["p95_ms"] / 1000:.6f}',
+                f"{metric}_sum {timing['mean_ms'] * timing['count'] / 1000:.6f}",
+                f"{metric}_count {timing['count']}"
+            ]
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serve /metrics in the Prometheus text format from a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+        return server
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+# Process-wide registry used by the handlers
+METRICS = Metrics()
@@ -1,12 +1,45 @@
+import email.policy
+import html
+import queue
 import smtplib
 import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 import os
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
+from urllib.parse import urlparse
 import logging
 
+from Attachments import AttachmentPipeline, ImageOptimizer, ImageSource
+from Backoff import backoff_delay
+from EmailTemplate import EmailTemplate, MessageTemplate
+from Metrics import METRICS
+from RateLimiter import RateLimiter
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px; }
+        .content { background: #f9f9f9; padding: 20px; border-radius: 10px; margin: 20px 0; }
+        .url-section { margin: 20px 0; }
+        .url-link { display: inline-block; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 5px 0; }
+        .url-link:hover { background: #0056b3; }
+        .image-section { text-align: center; margin: 20px 0; }
+        .email-image { max-width: 100%; height: auto; border-radius: 5px; margin: 10px; }
+    </style>
+</head>
+<body>
+    <div class="content">"""
+
+_HTML_TAIL = """    </div>
+</body>
+</html>"""
 
 
 class NotificationHandler:
@@ -15,30 +48,44 @@ class NotificationHandler:
     URL links, and image attachments.
     """
 
-    def __init__(self, email: str, password: str, provider: str = 'gmail'):
+    def __init__(self, email: str, password: str, provider: str = 'gmail',
+                 smtp_server: Optional[str] = None, smtp_port: Optional[int] = None,
+                 attachment_pipeline: Optional[AttachmentPipeline] = None):
         """
         Initialize the email handler.
         Args:
             email: Your email address
             password: Your email password (use app password for Gmail)
-            provider: Email provider ('gmail', 'outlook', 'yahoo')
+            provider: Email provider ('gmail', 'outlook', 'yahoo', or 'local' for
+                      a plain SMTP relay without TLS)
+            smtp_server: Overrides the provider's SMTP host
+            smtp_port: Overrides the provider's SMTP port
+            attachment_pipeline: Loads and recompresses images (defaults to
+                                 recompressing photos over 512 KB)
         """
         self.sender_email = email
         self.password = password
+        self.attachment_pipeline = attachment_pipeline if attachment_pipeline is not None else AttachmentPipeline(
+            ImageOptimizer()
+        )
 
         # SMTP configurations for different providers
+        # rate_limit is the default bulk sending rate in messages per second
         smtp_configs = {
-            'gmail': {'server': 'smtp.gmail.com', 'port': 587},
-            'outlook': {'server': 'smtp-mail.outlook.com', 'port': 587},
-            'yahoo': {'server': 'smtp.mail.yahoo.com', 'port': 587}
+            'gmail': {'server': 'smtp.gmail.com', 'port': 587, 'rate_limit': 10, 'starttls': True},
+            'outlook': {'server': 'smtp-mail.outlook.com', 'port': 587, 'rate_limit': 0.5, 'starttls': True},
+            'yahoo': {'server': 'smtp.mail.yahoo.com', 'port': 587, 'rate_limit': 1, 'starttls': True},
+            'local': {'server': 'localhost', 'port': 25, 'rate_limit': None, 'starttls': False}
         }
 
         if provider.lower() not in smtp_configs:
             raise ValueError(f"Unsupported provider: {provider}")
 
         config = smtp_configs[provider.lower()]
-        self.smtp_server = config['server']
-        self.smtp_port = config['port']
+        self.smtp_server = smtp_server or config['server']
+        self.smtp_port = smtp_port or config['port']
+        self.rate_limit = config['rate_limit']
+        self.starttls = config['starttls']
 
         # Setup basic logging
         logging.basicConfig(level=logging.INFO)
@@ -47,71 +94,55 @@ class NotificationHandler:
     def create_email_content(self,
                              text_content: str,
                              urls: Optional[List[Dict[str, str]]] = None,
-                             images: Optional[List[str]] = None) -> str:
+                             images: Optional[list] = None) -> str:
         """
-        Create HTML email content with text, URLs, and images.
+        Create the HTML email content with text, URLs, and images.
+
+        User-supplied text and URLs are HTML-escaped. The result is an
+        EmailTemplate source: {{ username }}, {{ branch }}, {{ sem }} and other
+        merge fields are filled in per recipient.
 
         Args:
-            text_content: Main text content of the email
+            text_content: Main text content of the email (may contain merge fields)
             urls: List of dicts with 'url' and 'text' keys for clickable links
-            images: List of image file paths to embed in email
+            images: Images to embed in email (file paths that do not exist are skipped)
 
         Returns:
-            HTML content string
-        """
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .content {{ background: #f9f9f9; padding: 20px; border-radius: 10px; margin: 20px 0; }}
-                .url-section {{ margin: 20px 0; }}
-                .url-link {{ display: inline-block; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 5px 0; }}
-                .url-link:hover {{ background: #0056b3; }}
-                .image-section {{ text-align: center; margin: 20px 0; }}
-                .email-image {{ max-width: 100%; height: auto; border-radius: 5px; margin: 10px; }}
-            </style>
-        </head>
-        <body>
-            <div class="content">
-                <div class="text-content">
-                    {text_content.replace(chr(10), '<br>')}
-                </div>
+            HTML template source
         """
+        parts = [_HTML_HEAD, '<p class="greeting">Hi {{ username | there }},</p>',
+                 '<div class="text-content">', html.escape(text_content).replace("\n", "<br>"), '</div>']
 
         # Add URLs section
-        if urls:
-            html_content += '<div class="url-section"><h3>Links:</h3>'
-            for url_item in urls:
-                url = url_item.get('url', '')
-                text = url_item.get('text', url)
-                html_content += f'<a href="{url}" class="url-link" target="_blank">{text}</a><br>'
-            html_content += '</div>'
+        links = []
+        for url_item in urls or []:
+            url = url_item.get('url', '')
+            if urlparse(url).scheme.lower() not in ('http', 'https', 'mailto'):
+                self.logger.warning(f"Skipping link with unsupported scheme: {url}")
+                continue
+            text = url_item.get('text') or url
+            links.append(f'<a href="{html.escape(url)}" class="url-link" target="_blank">{html.escape(text)}</a><br>')
+        if links:
+            parts += ['<div class="url-section"><h3>Links:</h3>', *links, '</div>']
 
         # Add images section
         if images:
-            html_content += '<div class="image-section"><h3>Images:</h3>'
+            parts.append('<div class="image-section"><h3>Images:</h3>')
             for i, image_path in enumerate(images):
-                if os.path.exists(image_path):
-                    html_content += f'<img src="cid:image_{i}" class="email-image" alt="Attached Image {i + 1}"><br>'
-            html_content += '</div>'
-
-        html_content += """
-            </div>
-        </body>
-        </html>
-        """
+                if not isinstance(image_path, str) or os.path.exists(image_path):
+                    parts.append(f'<img src="cid:image_{i}" class="email-image" alt="Attached Image {i + 1}"><br>')
+            parts.append('</div>')
 
-        return html_content
+        parts.append(_HTML_TAIL)
+        return "\n".join(parts)
 
     def send_email(self,
                    recipients: List[str],
                    subject: str,
                    text_content: str,
                    urls: Optional[List[Dict[str, str]]] = None,
-                   images: Optional[List[str]] = None) -> Dict[str, bool]:
+                   images: Optional[List[ImageSource]] = None,
+                   merge_fields: Optional[Dict[str, dict]] = None) -> Dict[str, bool]:
         """
         Send email to multiple recipients with text, URLs, and images.
 
@@ -121,63 +152,260 @@ class NotificationHandler:
             text_content: Main text content
             urls: List of dicts with 'url' and 'text' keys
                   Example: [{'url': 'https://google.com', 'text': 'Visit Google'}]
-            images: List of image file paths to attach
+            images: Image file paths, bytes/memoryview buffers or uploaded files
                    Example: ['photo1.jpg', 'logo.png']
+            merge_fields: Per-recipient template values, e.g.
+                          {'a@college.edu': {'username': 'Asha', 'branch': 'Civil', 'sem': 3}}
 
         Returns:
             Dict mapping email addresses to success status (True/False)
         """
         results = {}
 
-        try:
-            # Create SSL context
-            context = ssl.create_default_context()
+        with METRICS.span("send_email"):
+            try:
+                # Build the message once; only the To header and merge fields differ per recipient
+                template = self._build_message_template(subject, text_content, urls, images)
+                merge_fields = merge_fields or {}
 
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.password)
+                with self._connect() as server:
+                    for recipient in recipients:
+                        try:
+                            with METRICS.span("smtp.send"):
+                                server.sendmail(self.sender_email, [recipient], template.render(recipient, merge_fields.get(recipient)))
+                            results[recipient] = True
+                            self.logger.info(f"Email sent successfully to {recipient}")
+
+                        except Exception as e:
+                            results[recipient] = False
+                            self.logger.error(f"Failed to send email to {recipient}: {str(e)}")
 
+            except Exception as e:
+                self.logger.error(f"Failed to connect to SMTP server: {str(e)}")
                 for recipient in recipients:
+                    results[recipient] = False
+
+        self._count_results(results)
+        return results
+
+    def send_bulk_email(self,
+                        recipients: List[str],
+                        subject: str,
+                        text_content: str,
+                        urls: Optional[List[Dict[str, str]]] = None,
+                        images: Optional[List[ImageSource]] = None,
+                        concurrency: int = 4,
+                        rate_limit: Optional[float] = None,
+                        max_retries: int = 3,
+                        backoff_seconds: float = 1.0,
+                        on_result: Optional[Callable[[str, bool], None]] = None,
+                        merge_fields: Optional[Dict[str, dict]] = None) -> Dict[str, bool]:
+        """
+        High-throughput variant of send_email for large recipient lists.
+
+        The MIME message and image parts are built once, only the HTML body is
+        rendered per recipient, and messages are sent over a small
+        pool of parallel SMTP connections. Dropped sessions are reopened and
+        failed recipients are retried with exponential backoff.
+
+        Args:
+            recipients: List of recipient email addresses
+            subject: Email subject
+            text_content: Main text content
+            urls: List of dicts with 'url' and 'text' keys
+            images: Image file paths, bytes/memoryview buffers or uploaded files
+            concurrency: Number of parallel SMTP connections
+            rate_limit: Maximum messages per second across all connections
+                        (defaults to the provider's limit)
+            max_retries: Attempts per recipient before it is marked as failed
+            backoff_seconds: Base delay of the exponential backoff between attempts
+            on_result: Called with (recipient, success) as soon as each recipient finishes
+            merge_fields: Per-recipient template values (username, branch, sem, ...)
+
+        Returns:
+            Dict mapping email addresses to success status (True/False)
+
+        Raises:
+            smtplib.SMTPAuthenticationError: The server rejected the login
+            Exception: The server could not be reached max_retries times in a row
+            In both cases the batch stops and unfinished recipients are not
+            passed to on_result.
+        """
+        results = {recipient: False for recipient in recipients}
+        if not recipients:
+            return results
+
+        template = self._build_message_template(subject, text_content, urls, images)
+        merge_fields = merge_fields or {}
+        limiter = RateLimiter(rate_limit if rate_limit is not None else self.rate_limit)
+        pending: "queue.Queue[str]" = queue.Queue()
+        for recipient in dict.fromkeys(recipients):
+            pending.put(recipient)
+
+        # Connection-level failures end the whole batch: retrying them per
+        # recipient would log in again for every attempt of every recipient,
+        # which gets accounts locked when the credentials are wrong
+        abort = threading.Event()
+        connected = threading.Event()
+        fatal_errors: List[Exception] = []
+        connect_failures = [0]
+        state_lock = threading.Lock()
+        first_connect_lock = threading.Lock()
+
+        def open_session() -> smtplib.SMTP:
+            try:
+                server = self._connect()
+            except smtplib.SMTPAuthenticationError as e:
+                fatal_errors.append(e)
+                abort.set()
+                raise
+            except Exception as e:
+                with state_lock:
+                    connect_failures[0] += 1
+                    if connect_failures[0] >= max_retries:
+                        fatal_errors.append(e)
+                        abort.set()
+                raise
+            with state_lock:
+                connect_failures[0] = 0
+            connected.set()
+            return server
+
+        def connect() -> smtplib.SMTP:
+            if connected.is_set():
+                return open_session()
+            # Until one session works, connect one worker at a time so bad
+            # credentials cost a single login
+            with first_connect_lock:
+                if abort.is_set():
+                    raise fatal_errors[0]
+                return open_session()
+
+        def worker():
+            server = None
+            try:
+                while not abort.is_set():
+                    try:
+                        recipient = pending.get_nowait()
+                    except queue.Empty:
+                        return
+
+                    finished = False
+                    for attempt in range(max_retries):
+                        try:
+                            if server is None:
+                                server = connect()
+                            limiter.acquire()
+                            with METRICS.span("smtp.send"):
+                                server.sendmail(self.sender_email, [recipient], template.render(recipient, merge_fields.get(recipient)))
+                            results[recipient] = True
+                            self.logger.debug(f"Email sent successfully to {recipient}")
+                            finished = True
+                            break
+                        except smtplib.SMTPRecipientsRefused as e:
+                            # Permanent per-recipient failure, retrying will not help
+                            self.logger.error(f"Recipient refused {recipient}: {str(e)}")
+                            finished = True
+                            break
+                        except Exception as e:
+                            if abort.is_set():
+                                break
+                            if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)) and server is not None:
+                                try:
+                                    server.close()
+                                except Exception:
+                                    pass
+                                server = None
+                            if attempt == max_retries - 1:
+                                self.logger.error(f"Failed to send email to {recipient}: {str(e)}")
+                                finished = True
+                                break
+                            delay = backoff_delay(backoff_seconds, attempt)
+                            self.logger.warning(f"Send to {recipient} failed ({str(e)}), retrying in {delay:.1f}s")
+                            time.sleep(delay)
+
+                    # Recipients interrupted by an aborted batch are not reported
+                    if finished and on_result is not None:
+                        on_result(recipient, results[recipient])
+            finally:
+                if server is not None:
                     try:
-                        # Create message
-                        message = MIMEMultipart('related')
-                        message['From'] = self.sender_email
-                        message['To'] = recipient
-                        message['Subject'] = subject
-
-                        # Create HTML content
-                        html_content = self.create_email_content(text_content, urls, images)
-
-                        # Add HTML part
-                        html_part = MIMEText(html_content, 'html')
-                        message.attach(html_part)
-
-                        # Add images as embedded attachments
-                        if images:
-                            for i, image_path in enumerate(images):
-                                if os.path.exists(image_path):
-                                    with open(image_path, 'rb') as img_file:
-                                        img_data = img_file.read()
-                                        image = MIMEImage(img_data)
-                                        image.add_header('Content-ID', f'<image_{i}>')
-                                        image.add_header('Content-Disposition',
-                                                         f'inline; filename="{os.path.basename(image_path)}"')
-                                        message.attach(image)
-                                else:
-                                    self.logger.warning(f"Image not found: {image_path}")
-
-                        # Send email
-                        server.send_message(message)
-                        results[recipient] = True
-                        self.logger.info(f"Email sent successfully to {recipient}")
-
-                    except Exception as e:
-                        results[recipient] = False
-                        self.logger.error(f"Failed to send email to {recipient}: {str(e)}")
-
-        except Exception as e:
-            self.logger.error(f"Failed to connect to SMTP server: {str(e)}")
-            for recipient in recipients:
-                results[recipient] = False
+                        server.quit()
+                    except Exception:
+                        pass
+
+        workers = max(1, min(concurrency, len(recipients)))
+        with METRICS.span("send_bulk_email"), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(worker) for _ in range(workers)]
+            for future in futures:
+                # Surface errors outside the per-send handling (e.g. in on_result)
+                # instead of losing the worker silently
+                future.result()
 
+        self._count_results(results)
+        sent = sum(results.values())
+        if fatal_errors:
+            self.logger.error(f"Bulk send aborted after {sent} sent: {str(fatal_errors[0])}")
+            raise fatal_errors[0]
+        self.logger.info(f"Bulk send finished: {sent} sent, {len(results) - sent} failed")
         return results
+
+    @staticmethod
+    def _count_results(results: Dict[str, bool]) -> None:
+        sent = sum(results.values())
+        METRICS.incr("emails.sent", sent)
+        METRICS.incr("emails.failed", len(results) - sent)
+
+    def _connect(self) -> smtplib.SMTP:
+        """
+        Open an authenticated SMTP session.
+        """
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+            if self.password:
+                server.login(self.sender_email, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _build_message_template(self,
+                                subject: str,
+                                text_content: str,
+                                urls: Optional[List[Dict[str, str]]] = None,
+                                images: Optional[List[ImageSource]] = None) -> MessageTemplate:
+        """
+        Build the message shared by every recipient; only the To header and
+        the HTML body's merge fields are filled in per recipient.
+        """
+        # Built with the SMTP policy so non-ASCII headers are RFC 2047 encoded
+        message = MIMEMultipart('related', policy=email.policy.SMTP)
+        message['From'] = self.sender_email
+        message['Subject'] = subject
+
+        sources = []
+        for image in images or []:
+            if isinstance(image, str) and not os.path.exists(image):
+                self.logger.warning(f"Image not found: {image}")
+            else:
+                sources.append(image)
+        with METRICS.span("attachments.prepare"):
+            attachments = self.attachment_pipeline.prepare(sources)
+
+        # Create HTML content
+        html_content = self.create_email_content(text_content, urls, attachments)
+
+        # Add HTML part; its base64 payload is spliced in per recipient
+        html_part = MIMEText("", 'html', 'utf-8')
+        message.attach(html_part)
+
+        # Add images as embedded attachments
+        for i, attachment in enumerate(attachments):
+            image = MIMEImage(attachment.data, _subtype=attachment.subtype)
+            image.add_header('Content-ID', f'<image_{i}>')
+            image.add_header('Content-Disposition', f'inline; filename="{attachment.filename}"')
+            message.attach(image)
+
+        return MessageTemplate(message, html_part, EmailTemplate(html_content), email.policy.SMTP)
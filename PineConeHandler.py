@@ -1,182 +1,498 @@
-import json
+import asyncio
+import functools
 import os
-import re
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import google.generativeai as genai
-import streamlit
-from dotenv import  load_dotenv
-from pinecone import Pinecone
-
-load_dotenv()
+from typing import Dict, List, Optional, Union
 
-class PineConeHandler:
-    def __init__(self , index_name : str):
-        pc = Pinecone(api_key= os.getenv('PINECONE_API_KEY'))
-        if not pc.has_index(index_name):
-            pc.create_index_for_model(
-                name=index_name,
-                cloud="aws",
-                region="us-east-1",
-                embed={
-                    "model": "llama-text-embed-v2",
-                    "field_map": {"text": "chunk_text"}
-                }
-            )
+from dotenv import  load_dotenv
 
-        self.index = pc.Index(index_name)
+from AudienceCache import AudienceCache, AudienceQuery, SharedAudienceCache
+from HybridRanker import HybridRanker
+from LLMScheduler import BACKGROUND, llm_priority
+from Metrics import METRICS
+from TagCache import TagCache
+from TagClassifier import TagClassifier, build_classifier
+from VectorBackend import PineconeBackend, VectorBackend, build_backend
 
-    def generate_tags(self , prompt : str):
-        # Predefined tags - both general and specific
-        tags = [
-            # General categories
-            "Technical", "Cultural", "Sports", "Workshop", "Seminar",
-            "Competition", "Networking", "Career", "Entertainment",
-            "Educational", "Creative", "Leadership", "Innovation", "Research",
-            "Business", "Health", "Environment", "Social", "Community",
-
-            # Technical subcategories
-            "Web Development", "Mobile Development", "Machine Learning", "Deep Learning",
-            "Generative AI", "Data Science", "Cybersecurity", "Cloud Computing",
-            "Blockchain", "IoT", "Robotics", "Game Development", "UI/UX Design",
-            "DevOps", "Software Engineering", "Database", "API Development",
-            "Frontend", "Backend", "Full Stack", "Python", "JavaScript", "Java",
-
-            # Cultural subcategories
-            "Singing", "Dancing", "Writing", "Poetry", "Literature", "Theater",
-            "Photography", "Painting", "Music", "Classical Music", "Folk Dance",
-            "Contemporary Dance", "Creative Writing", "Storytelling", "Drama",
-            "Film Making", "Art Exhibition", "Sculpture", "Crafts", "Fashion",
-
-            # Sports subcategories
-            "Football", "Basketball", "Cricket", "Tennis", "Badminton", "Swimming",
-            "Athletics", "Volleyball", "Table Tennis", "Chess", "Cycling",
-            "Running", "Marathon", "Fitness", "Yoga", "Gym", "Martial Arts",
-            "Boxing", "Wrestling", "Hockey", "Baseball", "Golf", "Archery"
-        ]
+load_dotenv()
 
-        # Configure Gemini (set your API key here or as environment variable)
-        genai.configure(api_key= os.getenv('GEMINI_API_KEY'))  # Replace with your actual API key
+NAMESPACE = "user_space"
 
-        model = genai.GenerativeModel('gemini-2.0-flash')
+INITIAL_TOP_K = 100
+# Largest top_k Pinecone serves when record fields are returned
+MAX_TOP_K = 1000
 
-        classification_prompt = f"""
-        Classify this prompt into relevant tags: "{prompt}"
+# Fields returned with each hit: what re-ranking, de-duplication and the
+# audience view need, leaving out the prompt text and phone number
+AUDIENCE_FIELDS = ["email", "username", "sem", "section", "branch", "tags"]
 
-        Available tags: {', '.join(tags)}
 
-        Return only a JSON array of all relevant tags (no limit on number of tags).
-        Include both general categories (like "Technical", "Sports") and specific subcategories (like "Machine Learning", "Basketball").
-        Example: ["Technical", "Machine Learning", "Workshop"]
+class PineConeHandler:
+    def __init__(self , index_name : str , tag_cache : Optional[TagCache] = None ,
+                 classifier : Union[str, TagClassifier] = 'llm_fallback' , index = None ,
+                 backend : Optional[Union[str, VectorBackend]] = None ,
+                 audience_cache : Optional[AudienceCache] = None , ranker : Optional[HybridRanker] = None ,
+                 max_workers : int = 8 , lazy : bool = False):
         """
+        Args:
+            index_name: Pinecone index holding the student records
+            tag_cache: Cache in front of the LLM classifier (defaults to TAG_CACHE_PATH)
+            classifier: 'llm', 'local', 'llm_fallback' or a TagClassifier instance
+            index: Pre-built Pinecone index object to use instead of connecting
+            backend: 'pinecone', 'local' or a VectorBackend instance storing the
+                     student records (defaults to the Pinecone index)
+            audience_cache: Cache of event audiences (defaults to a SharedAudienceCache at
+                            AUDIENCE_CACHE_PATH, or an in-process AudienceCache)
+            ranker: Hybrid re-ranker holding the score weights and threshold
+            max_workers: Threads available to the async API for blocking SDK calls
+            lazy: Defer connecting to the vector store until first use (see
+                  warm_up_in_background) instead of connecting here
+        """
+        self.tag_cache = tag_cache if tag_cache is not None else TagCache(
+            path=os.getenv('TAG_CACHE_PATH', 'tag_cache.sqlite3')
+        )
+        if isinstance(classifier, str):
+            classifier = build_classifier(classifier, cache=self.tag_cache)
+        self.classifier = classifier
+        if audience_cache is None:
+            # A shared file lets several worker processes reuse and invalidate each other's audiences
+            audience_cache = SharedAudienceCache(os.getenv('AUDIENCE_CACHE_PATH')) if os.getenv('AUDIENCE_CACHE_PATH') \
+                else AudienceCache()
+        self.audience_cache = audience_cache
+        self.ranker = ranker if ranker is not None else HybridRanker(self.classifier.vocabulary)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="PineConeHandler")
+
+        self._index_name = index_name
+        self._index = index
+        self._backend_spec = backend
+        self._backend : Optional[VectorBackend] = backend if isinstance(backend, VectorBackend) else None
+        self._backend_lock = threading.Lock()
+        self.readiness : Dict[str, str] = {"vector_store": "pending", "classifier": "pending"}
+        if not lazy:
+            self.warm_up()
+
+    @property
+    def backend(self) -> VectorBackend:
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    if isinstance(self._backend_spec, str):
+                        self._backend = build_backend(self._backend_spec, index_name=self._index_name)
+                    else:
+                        self._backend = PineconeBackend(self._index_name, namespace=NAMESPACE, index=self._index)
+        return self._backend
+
+    def warm_up(self):
+        """
+        Connect to the vector store and build the classifier's model now
+        rather than on the first request. Progress is tracked in readiness.
+        """
+        for component, warm in (("vector_store", lambda: self.backend.warm_up()),
+                                ("classifier", self.classifier.warm_up)):
+            try:
+                with METRICS.span(f"warm_up.{component}"):
+                    warm()
+                self.readiness[component] = "ready"
+            except Exception as e:
+                # Requests retry the connection on first use
+                self.readiness[component] = f"failed: {e}"
+                print(f"Warm-up of {component} failed: {e}")
+
+    def _mark_ready(self , component : str):
+        # A failed warm-up is retried lazily on first use; once that works
+        # the component is ready after all
+        if self.readiness[component] != "ready":
+            self.readiness[component] = "ready"
+
+    def warm_up_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, name="PineConeHandlerWarmUp", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def is_ready(self) -> bool:
+        return all(status == "ready" for status in self.readiness.values())
+
+    def stats(self) -> dict:
+        """
+        Process metrics and cache statistics, as shown in the Performance tab.
+        """
+        return {
+            "metrics": METRICS.snapshot(),
+            "tag_cache": self.tag_cache.stats(),
+            "audience_cache": self.audience_cache.stats()
+        }
 
-        try:
-            response = model.generate_content(classification_prompt)
-
-            # Extract JSON from response
-            json_match = re.search(r'\[.*?\]', response.text)
-            if json_match:
-                result = json.loads(json_match.group())
-                return [tag for tag in result if tag in tags]
-
-            return []
-
-        except:
-            # Enhanced fallback matching with broader categories
-            prompt_lower = prompt.lower()
-            matched = []
+    def generate_tags(self , prompt : str):
+        with METRICS.span("generate_tags"):
+            try:
+                tags = self.classifier.classify(prompt)
+                self._mark_ready("classifier")
+                return tags
+            except Exception as e:
+                METRICS.incr("generate_tags.failures")
+                print(f"Tag classification failed: {e}")
+                return []
+
+    def generate_tags_batch(self , prompts : List[str]) -> List[List[str]]:
+        with METRICS.span("generate_tags_batch"):
+            try:
+                tags = self.classifier.classify_batch(prompts)
+                self._mark_ready("classifier")
+                return tags
+            except Exception as e:
+                METRICS.incr("generate_tags.failures")
+                print(f"Tag classification failed: {e}")
+                return [[] for _ in prompts]
+
+
+    async def _run_blocking(self , func , *args , **kwargs):
+        # The Pinecone and Gemini SDK calls are blocking, so run them on the handler's pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def agenerate_tags(self , prompt : str) -> List[str]:
+        return await self._run_blocking(self.generate_tags, prompt)
+
+    @staticmethod
+    def normalize_email(email : str) -> str:
+        return email.strip().lower()
+
+    @staticmethod
+    def student_id(email : str) -> str:
+        """
+        Stable record id for a student, so re-registering overwrites the old record.
+        """
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"mailto:{PineConeHandler.normalize_email(email)}"))
+
+    def build_record(self, user_prompt :str , email : str, mobile_no : str ,  username : str,  sem , section : str , branch : str , tags : List[str]) -> dict:
+        return {
+            "_id": self.student_id(email),
+            "chunk_text": user_prompt,
+            "email": email,
+            "username": username,
+            "generation_date": datetime.now().isoformat(),
+            "tags": tags ,
+            "sem": int(sem),
+            "section": section,
+            "mobile_no" : mobile_no ,
+            "branch" : branch
+        }
+
+    def upsert_records(self , records : List[dict]):
+        with METRICS.span("vector.upsert"):
+            self.backend.upsert(records)
+        self._mark_ready("vector_store")
+        METRICS.incr("students.saved", len(records))
+        self.audience_cache.invalidate(records)
+
+    def delete_records(self , records : List[dict]):
+        """
+        Args:
+            records: Stored records ({'_id', 'fields'} as returned by backend.scan)
+        """
+        with METRICS.span("vector.delete"):
+            self.backend.delete([record['_id'] for record in records])
+        self.audience_cache.invalidate([{'_id': record['_id'], **record['fields']} for record in records])
 
-            keywords = {
-                # General Technical
-                "Technical": ["coding", "programming", "tech", "software", "development", "computer"],
+    def save_embdeddings(self, user_prompt :str , email : str, mobile_no : str ,  username : str,  sem : str , section : str , branch : str):
+        with METRICS.span("save_embdeddings"):
+            # Registrations can wait; event matching gets the LLM first
+            with llm_priority(BACKGROUND):
+                tags = self.generate_tags(user_prompt)
+            try :
+                self.upsert_records([
+                    self.build_record(user_prompt, email, mobile_no, username, sem, section, branch, tags)
+                ])
+                return "User Date is Uploaded"
+            except Exception as e:  # Catching a general exception
+                print(f"An unexpected error occurred: {e}")
+
+
+    async def asave_embdeddings(self, user_prompt :str , email : str, mobile_no : str ,  username : str,  sem : str , section : str , branch : str):
+        return await self._run_blocking(
+            self.save_embdeddings, user_prompt, email, mobile_no, username, sem, section, branch
+        )
 
-                # Technical Specific
-                "Web Development": ["web", "website", "html", "css", "javascript", "react", "angular"],
-                "Machine Learning": ["machine learning", "ml", "model", "algorithm", "prediction"],
-                "Deep Learning": ["deep learning", "neural network", "tensorflow", "pytorch"],
-                "Generative AI": ["genai", "generative", "chatgpt", "llm", "ai generation"],
-                "Data Science": ["data science", "analytics", "visualization", "pandas", "statistics"],
-                "Mobile Development": ["mobile", "android", "ios", "app development", "flutter"],
+    def save_students(self , students : List[dict]) -> int:
+        """
+        Register a batch of students with one classification call and one upsert.
 
-                # General Cultural
-                "Cultural": ["cultural", "art", "music", "dance", "traditional", "heritage"],
+        Args:
+            students: Dicts with user_prompt, email, username, sem, section,
+                      branch and optionally mobile_no
 
-                # Cultural Specific
-                "Singing": ["singing", "vocal", "song", "melody", "choir"],
-                "Dancing": ["dancing", "dance", "choreography", "ballet", "hip hop"],
-                "Writing": ["writing", "author", "novel", "story", "blog", "content"],
-                "Poetry": ["poetry", "poem", "verse", "rhyme", "spoken word"],
-                "Photography": ["photography", "photo", "camera", "portrait", "landscape"],
+        Returns:
+            Number of records saved
+        """
+        with METRICS.span("save_students"):
+            with llm_priority(BACKGROUND):
+                tags = self.generate_tags_batch([student['user_prompt'] for student in students])
+            records = [
+                self.build_record(student['user_prompt'], student['email'], student.get('mobile_no', ""),
+                                  student['username'], student['sem'], student['section'], student['branch'],
+                                  student_tags)
+                for student, student_tags in zip(students, tags)
+            ]
+            # Several submissions for the same email collapse into the last one
+            records = list({record['_id']: record for record in records}.values())
+            self.upsert_records(records)
+            return len(records)
+
+    async def asave_students(self , students : List[dict]) -> int:
+        return await self._run_blocking(self.save_students, students)
+
+    @staticmethod
+    def build_filter(sem_from , sem_to , branch : Optional[Union[str, List[str]]] = None ,
+                     section : Optional[Union[str, List[str]]] = None ,
+                     required_tags : Optional[List[str]] = None) -> dict:
+        """
+        Build the Pinecone-style metadata filter for an event's target audience.
+        branch and section accept a single value or a list of allowed values;
+        every tag in required_tags must be present on the student.
+        """
+        conditions = [{"sem": {"$gte": int(sem_from), "$lte": int(sem_to)}}]
+        for field_name, value in (("branch", branch), ("section", section)):
+            if value:
+                if isinstance(value, str):
+                    conditions.append({field_name: {"$eq": value}})
+                else:
+                    conditions.append({field_name: {"$in": list(value)}})
+        for tag in required_tags or []:
+            conditions.append({"tags": {"$in": [tag]}})
+
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _search(self , event_prompt : str , top_k : int , metadata_filter : dict) -> List[dict]:
+        with METRICS.span("vector.search"):
+            hits = self.backend.search(event_prompt, top_k, metadata_filter, fields=AUDIENCE_FIELDS)
+        self._mark_ready("vector_store")
+        return hits
+
+    def compare_embeddings(self , event_prompt:str , sem_to , sem_from ,
+                           branch : Optional[Union[str, List[str]]] = None ,
+                           section : Optional[Union[str, List[str]]] = None ,
+                           required_tags : Optional[List[str]] = None ,
+                           limit : Optional[int] = None ,
+                           top_k : int = INITIAL_TOP_K) -> List[dict]:
+        """
+        Find the students an event should be sent to.
 
-                # General Sports
-                "Sports": ["sports", "game", "fitness", "tournament", "match", "athletic"],
+        Semester, branch, section and required tags are applied by the vector
+        backend as a metadata filter. The search starts at top_k candidates and doubles until
+        `limit` students pass the score threshold, the candidates run out, or the
+        remaining candidates are too dissimilar to pass even with a perfect tag match.
 
-                # Sports Specific
-                "Football": ["football", "soccer", "fifa", "goal", "field"],
-                "Basketball": ["basketball", "nba", "court", "dribble", "shoot"],
-                "Cricket": ["cricket", "bat", "ball", "wicket", "ipl"],
-                "Swimming": ["swimming", "pool", "stroke", "freestyle", "butterfly"],
-                "Chess": ["chess", "checkmate", "strategy", "board game"],
+        Returns the passing hits sorted by their hybrid 'final_score'. Audiences
+        are cached until a student who could belong to them is saved.
+        """
+        query = self._audience_query(event_prompt, sem_to, sem_from, branch, section, required_tags, limit)
+        with METRICS.span("compare_embeddings"):
+            cached = self.audience_cache.get(query)
+            if cached is not None:
+                METRICS.incr("audience_cache.hits")
+                return cached
+
+            METRICS.incr("audience_cache.misses")
+            tags = self.generate_tags(event_prompt)
+            metadata_filter = self.build_filter(sem_from, sem_to, branch, section, required_tags)
+            first_page = self._search(event_prompt, top_k, metadata_filter)
+            final_list = self._rank_audience(event_prompt, tags, metadata_filter, limit, top_k, first_page)
+            self.audience_cache.put(query, final_list)
+            return final_list
+
+    async def acompare_embeddings(self , event_prompt:str , sem_to , sem_from ,
+                                  branch : Optional[Union[str, List[str]]] = None ,
+                                  section : Optional[Union[str, List[str]]] = None ,
+                                  required_tags : Optional[List[str]] = None ,
+                                  limit : Optional[int] = None ,
+                                  top_k : int = INITIAL_TOP_K) -> List[dict]:
+        """
+        Async version of compare_embeddings. Tag classification and the first
+        vector search run concurrently, since the search does not need the tags.
+        """
+        query = self._audience_query(event_prompt, sem_to, sem_from, branch, section, required_tags, limit)
+        with METRICS.span("compare_embeddings"):
+            cached = self.audience_cache.get(query)
+            if cached is not None:
+                METRICS.incr("audience_cache.hits")
+                return cached
+
+            METRICS.incr("audience_cache.misses")
+            metadata_filter = self.build_filter(sem_from, sem_to, branch, section, required_tags)
+            tags, first_page = await asyncio.gather(
+                self.agenerate_tags(event_prompt),
+                self._run_blocking(self._search, event_prompt, top_k, metadata_filter)
+            )
+            final_list = await self._run_blocking(
+                self._rank_audience, event_prompt, tags, metadata_filter, limit, top_k, first_page
+            )
+            self.audience_cache.put(query, final_list)
+            return final_list
 
-                # General Categories
-                "Workshop": ["workshop", "hands-on", "training", "learn", "practical"],
-                "Competition": ["competition", "contest", "hackathon", "challenge", "tournament"],
-                "Career": ["career", "job", "professional", "internship", "placement"]
-            }
+    def match_events(self , events : List[dict] , top_k : int = INITIAL_TOP_K) -> List[List[dict]]:
+        """
+        Match a batch of events in one pass.
 
-            for tag, words in keywords.items():
-                if any(word in prompt_lower for word in words):
-                    matched.append(tag)
-        return []
+        All uncached events share one classify_batch call, and their vector
+        searches run concurrently on the handler's pool while the tags are
+        being classified.
 
+        Args:
+            events: Dicts of compare_embeddings arguments (event_prompt, sem_to,
+                    sem_from and optionally branch, section, required_tags, limit)
+            top_k: Candidates fetched by each first search
 
-    def save_embdeddings(self, user_prompt :str , email : str, mobile_no : str ,  username : str,  sem : str , section : str , branch : str):
-        vector_id = str(uuid.uuid4())
-        tags = self.generate_tags(user_prompt)
-        try :
-            self.index.upsert_records(
-                "user_space",
-                [
-                    {
-                        "_id": vector_id,
-                        "chunk_text": user_prompt,
-                        "email": email,
-                        "username": username,
-                        "generation_date": datetime.now(),
-                        "tags": tags ,
-                        "sem": sem,
-                        "section": section,
-                        "mobile_no" : mobile_no ,
-                        "branch" : branch
-                    }
-                ]
+        Returns:
+            The audience of each event, in the same order as events
+        """
+        with METRICS.span("match_events"):
+            queries = [
+                self._audience_query(event['event_prompt'], event['sem_to'], event['sem_from'], event.get('branch'),
+                                     event.get('section'), event.get('required_tags'), event.get('limit'))
+                for event in events
+            ]
+            audiences : List[Optional[List[dict]]] = [self.audience_cache.get(query) for query in queries]
+            missing = [i for i, audience in enumerate(audiences) if audience is None]
+            METRICS.incr("audience_cache.hits", len(events) - len(missing))
+            METRICS.incr("audience_cache.misses", len(missing))
+            if not missing:
+                return audiences
+
+            tags_future = self._executor.submit(
+                self.generate_tags_batch, [events[i]['event_prompt'] for i in missing]
             )
-            return "User Date is Uploaded"
-        except Exception as e:  # Catching a general exception
-            print(f"An unexpected error occurred: {e}")
-
-
-    def compare_embeddings(self , event_prompt:str , sem_to : str , sem_from : str) :
-        tags = self.generate_tags(event_prompt)
-        filtered_results = self.index.search(
-            namespace="user_space",
-            query={
-                "inputs": {"text": event_prompt},
-                "top_k": 100
-            },
+            filters = {
+                i: self.build_filter(events[i]['sem_from'], events[i]['sem_to'], events[i].get('branch'),
+                                     events[i].get('section'), events[i].get('required_tags'))
+                for i in missing
+            }
+            first_pages = {
+                i: self._executor.submit(self._search, events[i]['event_prompt'], top_k, filters[i]) for i in missing
+            }
+            ranked = {
+                i: self._executor.submit(self._rank_audience, events[i]['event_prompt'], tags, filters[i],
+                                         events[i].get('limit'), top_k, first_pages[i].result())
+                for i, tags in zip(missing, tags_future.result())
+            }
+            for i, future in ranked.items():
+                audiences[i] = future.result()
+                self.audience_cache.put(queries[i], audiences[i])
+            return audiences
+
+    async def amatch_events(self , events : List[dict] , top_k : int = INITIAL_TOP_K) -> List[List[dict]]:
+        # match_events waits on tasks it submits to the handler's pool, so it
+        # must not occupy a slot of that pool itself
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.match_events, events, top_k))
+
+    def _audience_query(self , event_prompt : str , sem_to , sem_from , branch , section ,
+                        required_tags , limit : Optional[int]) -> AudienceQuery:
+        return AudienceQuery(
+            event_prompt=event_prompt,
+            sem_from=sem_from,
+            sem_to=sem_to,
+            vocabulary_version=TagCache.vocabulary_hash(self.classifier.vocabulary),
+            branch=branch,
+            section=section,
+            required_tags=required_tags,
+            limit=limit
         )
-        results_list = filtered_results['results']['hits']
+
+    def _rank_audience(self , event_prompt : str , tags : List[str] , metadata_filter : dict ,
+                       limit : Optional[int] , top_k : int , results_list : List[dict]) -> List[dict]:
+        """
+        Re-rank the first page of hits and keep growing top_k while more
+        students could still pass. When MAX_TOP_K is reached and more could
+        still pass, the search is split into one search per semester.
+        """
         final_list = []
-        ##results_list is a list[dict]
-        for result in results_list :
-            if sem_to >= result['fields']['sem'] >= sem_from:
-                score = result['score']
-                user_tags = result['fields']['tags']
-                jaccard_similarity = self.compare_list_js(user_tags , tags)
-                final_score = 0.7*score + 0.3*jaccard_similarity
-                if final_score >= 0.6:
-                    final_list.append(result)
-        return final_list
+        seen_emails = set()
+        seen_ids = set()
+        capped = self._grow_audience(event_prompt, tags, metadata_filter, limit, top_k, results_list,
+                                     final_list, seen_emails, seen_ids)
+        if capped:
+            semester_filters = self._semester_filters(metadata_filter)
+            if len(semester_filters) > 1:
+                METRICS.incr("candidates.split")
+                top_k = max(top_k, -(-MAX_TOP_K // len(semester_filters)))
+                capped = False
+                for semester_filter in semester_filters:
+                    if limit is not None and len(final_list) >= limit:
+                        break
+                    capped |= self._grow_audience(event_prompt, tags, semester_filter, limit, top_k,
+                                                  self._search(event_prompt, top_k, semester_filter),
+                                                  final_list, seen_emails, seen_ids)
+            if capped:
+                METRICS.incr("candidates.capped")
+                print(f"Audience search hit top_k={MAX_TOP_K}; more students may pass than were returned")
+
+        final_list.sort(key=lambda result: result['final_score'], reverse=True)
+        return final_list[:limit] if limit is not None else final_list
+
+    def _grow_audience(self , event_prompt : str , tags : List[str] , metadata_filter : dict ,
+                       limit : Optional[int] , top_k : int , results_list : List[dict] ,
+                       final_list : List[dict] , seen_emails : set , seen_ids : set) -> bool:
+        """
+        Add the passing hits of one filtered search to final_list, doubling
+        top_k as needed. Returns True when MAX_TOP_K was reached while more
+        students could still pass.
+        """
+        while True:
+            # Score every hit not seen in an earlier round. Ties near the page
+            # boundary can reorder a re-fetched list, so its first hits are
+            # not necessarily the ones already scored
+            fresh = [hit for hit in results_list if hit['_id'] not in seen_ids]
+            seen_ids.update(hit['_id'] for hit in fresh)
+            new_hits = self._unique_students(fresh, seen_emails)
+            with METRICS.span("rerank"):
+                passing = self.ranker.rank(new_hits, tags)
+            METRICS.incr("candidates.duplicates", len(fresh) - len(new_hits))
+            METRICS.incr("candidates.scanned", len(fresh))
+            METRICS.incr("candidates.passing", len(passing))
+            final_list.extend(passing)
+
+            if len(results_list) < top_k:
+                return False
+            if limit is not None and len(final_list) >= limit:
+                return False
+            # Hits are sorted by score, so nothing further down can pass
+            if not self.ranker.can_pass(results_list[-1]['_score']):
+                return False
+            if top_k >= MAX_TOP_K:
+                return True
+            top_k = min(top_k * 2, MAX_TOP_K)
+            # Search has no offset, so each round re-fetches the earlier pages
+            results_list = self._search(event_prompt, top_k, metadata_filter)
+
+    @staticmethod
+    def _semester_filters(metadata_filter : dict) -> List[dict]:
+        """
+        Split a build_filter filter into one filter per semester of its range.
+        """
+        conditions = metadata_filter.get("$and", [metadata_filter])
+        sem_range, others = conditions[0]["sem"], conditions[1:]
+        return [
+            {"$and": [{"sem": {"$gte": sem, "$lte": sem}}, *others]} if others else {"sem": {"$gte": sem, "$lte": sem}}
+            for sem in range(sem_range["$gte"], sem_range["$lte"] + 1)
+        ]
+
+    def _unique_students(self , hits : List[dict] , seen_emails : set) -> List[dict]:
+        """
+        Drop hits whose email was already seen. Hits arrive sorted by score,
+        so each student keeps their best-scoring record.
+        """
+        unique = []
+        for hit in hits:
+            email = hit['fields'].get('email')
+            key = self.normalize_email(email) if email else hit['_id']
+            if key not in seen_emails:
+                seen_emails.add(key)
+                unique.append(hit)
+        return unique
 
     def compare_list_js(self , list1 , list2 )->float :
         set1 = set(list1)
@@ -0,0 +1,112 @@
+import argparse
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from BulkImporter import MAX_UPSERT_BATCH
+from PineConeHandler import PineConeHandler
+
+
+@dataclass
+class CompactionReport:
+    """
+    Summary of a compaction run.
+    """
+    scanned: int = 0
+    students: int = 0
+    migrated: int = 0
+    deleted: int = 0
+    skipped: int = 0
+
+
+class StudentCompactor:
+    """
+    One-off job that merges duplicate student records.
+
+    Records used to get a random id per registration, so a student who signed
+    up twice is stored twice. The compactor groups records by normalized email,
+    keeps the most recent registration under the stable id from
+    PineConeHandler.student_id and deletes the rest. Records are upserted
+    before the duplicates are deleted, so an interrupted run loses nothing and
+    can simply be started again.
+    """
+
+    def __init__(self, handler: PineConeHandler, batch_size: int = MAX_UPSERT_BATCH, dry_run: bool = False):
+        """
+        Args:
+            handler: Handler whose backend holds the student records
+            batch_size: Records per upsert or delete call
+            dry_run: Only report what would change
+        """
+        self.handler = handler
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.logger = logging.getLogger('StudentCompactor')
+
+    def plan(self, report: CompactionReport) -> tuple:
+        """
+        Scan the backend and work out the records to write and delete.
+
+        Returns:
+            (records to upsert, stored records to delete)
+        """
+        students: Dict[str, List[dict]] = defaultdict(list)
+        for batch in self.handler.backend.scan():
+            report.scanned += len(batch)
+            for record in batch:
+                email = record['fields'].get('email')
+                if not email:
+                    report.skipped += 1
+                    continue
+                students[PineConeHandler.normalize_email(email)].append(record)
+
+        upserts, deletes = [], []
+        for email, records in students.items():
+            report.students += 1
+            stable_id = PineConeHandler.student_id(email)
+            latest = max(records, key=lambda record: record['fields'].get('generation_date') or "")
+            if latest['_id'] != stable_id:
+                if 'chunk_text' not in latest['fields']:
+                    self.logger.warning(f"Skipping {email}: record {latest['_id']} has no chunk_text to re-embed")
+                    report.skipped += len(records)
+                    continue
+                upserts.append(dict(latest['fields'], _id=stable_id))
+            deletes.extend(record for record in records if record['_id'] != stable_id)
+
+        report.migrated = len(upserts)
+        report.deleted = len(deletes)
+        return upserts, deletes
+
+    def run(self) -> CompactionReport:
+        report = CompactionReport()
+        upserts, deletes = self.plan(report)
+        self.logger.info(
+            f"{report.scanned} records for {report.students} students: "
+            f"{report.migrated} to rewrite under stable ids, {report.deleted} to delete"
+        )
+        if self.dry_run:
+            return report
+
+        for start in range(0, len(upserts), self.batch_size):
+            self.handler.upsert_records(upserts[start:start + self.batch_size])
+        for start in range(0, len(deletes), self.batch_size):
+            self.handler.delete_records(deletes[start:start + self.batch_size])
+        return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Merge duplicate student records into one record per email")
+    parser.add_argument("--index", required=True, help="Pinecone index name")
+    parser.add_argument("--backend", default="pinecone", choices=["pinecone", "local"])
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    handler = PineConeHandler(index_name=args.index, classifier="local", backend=args.backend)
+    StudentCompactor(handler, dry_run=args.dry_run).run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+
+class TagCache:
+    """
+    Persistent, content-addressed cache for tag classifications.
+
+    Entries are keyed on the normalized prompt text plus a hash of the tag
+    vocabulary and the classifier version, so changing either never serves
+    stale tags. The store
+    is a SQLite file, bounded by LRU eviction and a time-to-live.
+    """
+
+    def __init__(self, path: str = "tag_cache.sqlite3", max_entries: int = 10000,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite database file (':memory:' for a process-local cache)
+            max_entries: Maximum number of cached prompts before LRU eviction
+            ttl_seconds: Age after which an entry is discarded (None disables expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tag_cache (
+                key TEXT PRIMARY KEY,
+                tags TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tag_cache_accessed ON tag_cache (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return " ".join(prompt.lower().split())
+
+    @staticmethod
+    def vocabulary_hash(vocabulary: Sequence[str]) -> str:
+        return hashlib.sha256("\n".join(vocabulary).encode("utf-8")).hexdigest()[:16]
+
+    def make_key(self, prompt: str, vocabulary: Sequence[str], version: str = "") -> str:
+        material = f"{self.vocabulary_hash(vocabulary)}\0{self.normalize(prompt)}"
+        if version:
+            material = f"{version}\0{material}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, vocabulary: Sequence[str], version: str = "") -> Optional[List[str]]:
+        """
+        Return the cached tags for a prompt, or None on a miss.
+
+        Args:
+            prompt: Text that was classified
+            vocabulary: Tags the classifier could return
+            version: Classifier version (see TagClassifier.cache_version)
+        """
+        key = self.make_key(prompt, vocabulary, version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tags, created FROM tag_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            tags, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM tag_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE tag_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(tags)
+
+    def put(self, prompt: str, vocabulary: Sequence[str], tags: List[str], version: str = "") -> None:
+        key = self.make_key(prompt, vocabulary, version)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tag_cache (key, tags, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(tags), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM tag_cache WHERE created < ?", (now - self.ttl_seconds,))
+
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM tag_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM tag_cache WHERE key IN "
+                "(SELECT key FROM tag_cache ORDER BY accessed ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tag_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM tag_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size
+        }
@@ -0,0 +1,354 @@
+import bisect
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from LLMScheduler import LLM_SCHEDULER, LLMScheduler
+from Metrics import METRICS
+from TagCache import TagCache
+from TagTaxonomy import TagTaxonomy
+
+# Tag hierarchy (general categories -> subcategories), stored in tag_taxonomy.json
+TAXONOMY = TagTaxonomy.load()
+
+# Flat tag vocabulary: general categories first, then subcategories
+TAGS = TAXONOMY.tags
+
+# Ask Gemini for raw JSON instead of prose or fenced code
+JSON_OUTPUT = {"response_mime_type": "application/json"}
+
+# Synonyms used by the local classifier, on top of the tag names themselves
+KEYWORDS = {
+    # General Technical
+    "Technical": ["coding", "programming", "tech", "software", "development", "computer"],
+
+    # Technical Specific
+    "Web Development": ["web", "website", "html", "css", "javascript", "react", "angular"],
+    "Machine Learning": ["machine learning", "ml", "model", "algorithm", "prediction"],
+    "Deep Learning": ["deep learning", "neural network", "tensorflow", "pytorch"],
+    "Generative AI": ["genai", "generative", "chatgpt", "llm", "ai generation"],
+    "Data Science": ["data science", "analytics", "visualization", "pandas", "statistics"],
+    "Mobile Development": ["mobile", "android", "ios", "app development", "flutter"],
+
+    # General Cultural
+    "Cultural": ["cultural", "art", "music", "dance", "traditional", "heritage"],
+
+    # Cultural Specific
+    "Singing": ["singing", "vocal", "song", "melody", "choir"],
+    "Dancing": ["dancing", "dance", "choreography", "ballet", "hip hop"],
+    "Writing": ["writing", "author", "novel", "story", "blog", "content"],
+    "Poetry": ["poetry", "poem", "verse", "rhyme", "spoken word"],
+    "Photography": ["photography", "photo", "camera", "portrait", "landscape"],
+
+    # General Sports
+    "Sports": ["sports", "game", "fitness", "tournament", "match", "athletic"],
+
+    # Sports Specific
+    "Football": ["football", "soccer", "fifa", "goal", "field"],
+    "Basketball": ["basketball", "nba", "court", "dribble", "shoot"],
+    "Cricket": ["cricket", "bat", "ball", "wicket", "ipl"],
+    "Swimming": ["swimming", "pool", "stroke", "freestyle", "butterfly"],
+    "Chess": ["chess", "checkmate", "strategy", "board game"],
+
+    # General Categories
+    "Workshop": ["workshop", "hands-on", "training", "learn", "practical"],
+    "Competition": ["competition", "contest", "hackathon", "challenge", "tournament"],
+    "Career": ["career", "job", "professional", "internship", "placement"]
+}
+
+
+class TagClassifier:
+    """
+    Base class for tag classifier backends.
+
+    Subclasses implement classify_batch; classify is a one-prompt convenience.
+    """
+
+    # Bump when a change to the classifier alters the tags it returns, so
+    # tags cached from the earlier version are not served
+    VERSION = 1
+
+    def __init__(self, vocabulary: Sequence[str] = TAGS, taxonomy: Optional[TagTaxonomy] = None):
+        self.vocabulary = list(vocabulary)
+        self.taxonomy = taxonomy if taxonomy is not None else TAXONOMY
+
+    def _with_parents(self, tags) -> List[str]:
+        """
+        Add the parent category of every subcategory and return the tags in
+        vocabulary order.
+        """
+        tags = set(tags)
+        tags.update(self.taxonomy.parents[tag] for tag in list(tags) if tag in self.taxonomy.parents)
+        return [tag for tag in self.vocabulary if tag in tags]
+
+    @property
+    def cache_version(self) -> str:
+        """
+        Identifies everything besides the vocabulary that determines the tags.
+        """
+        return f"{type(self).__name__}/{self.VERSION}/{self.taxonomy.fingerprint}"
+
+    def classify(self, prompt: str) -> List[str]:
+        return self.classify_batch([prompt])[0]
+
+    def classify_batch(self, prompts: Sequence[str]) -> List[List[str]]:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """
+        Build any clients ahead of the first request. A no-op by default.
+        """
+
+
+class LocalTagClassifier(TagClassifier):
+    """
+    Deterministic keyword classifier that needs no network access.
+
+    The tag names and all of their synonyms are compiled into a single regex
+    alternation. Matches must sit on word boundaries, so "ml" does not match
+    "html", and a trailing plural "s"/"es" is accepted.
+    """
+
+    def __init__(self, vocabulary: Sequence[str] = TAGS,
+                 keywords: Optional[Dict[str, List[str]]] = None,
+                 taxonomy: Optional[TagTaxonomy] = None):
+        super().__init__(vocabulary, taxonomy)
+        keywords = KEYWORDS if keywords is None else keywords
+
+        self._phrase_tags: Dict[str, List[str]] = {}
+        for tag in self.vocabulary:
+            self._add_phrase(tag, tag)
+        for tag, words in keywords.items():
+            if tag in self.vocabulary:
+                for word in words:
+                    self._add_phrase(word, tag)
+
+        # Longest phrases first so "machine learning" wins over "machine"
+        phrases = sorted(self._phrase_tags, key=len, reverse=True)
+        alternation = "|".join(re.escape(phrase) for phrase in phrases)
+        self._pattern = re.compile(rf"(?<![a-z0-9])({alternation})(?:e?s)?(?![a-z0-9])")
+
+    def _add_phrase(self, phrase: str, tag: str) -> None:
+        tags = self._phrase_tags.setdefault(phrase.lower(), [])
+        if tag not in tags:
+            tags.append(tag)
+
+    def classify_batch(self, prompts: Sequence[str]) -> List[List[str]]:
+        # Scan all prompts in one pass over a newline-joined buffer and map
+        # each match back to its prompt through the buffer offsets
+        texts = [" ".join(prompt.lower().split()) for prompt in prompts]
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        matched: List[set] = [set() for _ in texts]
+        for match in self._pattern.finditer("\n".join(texts)):
+            position = bisect.bisect_right(starts, match.start()) - 1
+            matched[position].update(self._phrase_tags[match.group(1)])
+
+        # Report tags in vocabulary order so results are deterministic
+        return [self._with_parents(tags) for tags in matched]
+
+
+class GeminiTagClassifier(TagClassifier):
+    """
+    Tag classifier backed by a Gemini model.
+
+    Classifies in two stages so each request lists only the tags it needs:
+    the model first picks general categories, then only the subcategories of
+    the categories it picked. Both stages use JSON output mode, and replies
+    are validated against the taxonomy, with parent categories added.
+
+    Raises on API or parsing failures so callers can decide how to fall back.
+    """
+
+    # 2: two-stage classification with parent categories added
+    VERSION = 2
+
+    def __init__(self, vocabulary: Sequence[str] = TAGS, model_name: str = 'gemini-2.0-flash',
+                 batch_size: int = 20, model=None, taxonomy: Optional[TagTaxonomy] = None,
+                 scheduler: Optional[LLMScheduler] = None):
+        """
+        Args:
+            vocabulary: Tags the model may return
+            model_name: Gemini model to call
+            batch_size: Prompts classified per request by classify_batch
+            model: Object with a generate_content(prompt, generation_config=...)
+                   method to use instead of a Gemini model (e.g. a stub for benchmarks)
+            taxonomy: Tag hierarchy (defaults to tag_taxonomy.json)
+            scheduler: Coalesces, rate-limits and prioritizes requests (defaults
+                       to the process-wide LLM_SCHEDULER)
+        """
+        super().__init__(vocabulary, taxonomy)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = model
+        self.scheduler = scheduler if scheduler is not None else LLM_SCHEDULER
+        self._model_lock = threading.Lock()
+
+    @property
+    def cache_version(self) -> str:
+        return f"{super().cache_version}/{self.model_name}"
+
+    def _get_model(self):
+        # Build the model once and share it between requests and threads
+        if self.model is None:
+            with self._model_lock:
+                if self.model is None:
+                    import google.generativeai as genai
+
+                    # Configure Gemini (set your API key here or as environment variable)
+                    genai.configure(api_key= os.getenv('GEMINI_API_KEY'))
+                    self.model = genai.GenerativeModel(self.model_name)
+        return self.model
+
+    def warm_up(self) -> None:
+        self._get_model()
+
+    def classify_batch(self, prompts: Sequence[str]) -> List[List[str]]:
+        results = []
+        for start in range(0, len(prompts), self.batch_size):
+            results.extend(self._classify_many(prompts[start:start + self.batch_size]))
+        return results
+
+    def _classify_many(self, prompts: Sequence[str]) -> List[List[str]]:
+        categories = [category for category in self.taxonomy.categories if category in self.vocabulary]
+        numbered = "\n".join(f"{i + 1}. {json.dumps(prompt)}" for i, prompt in enumerate(prompts))
+        replies = self._generate(f"""
+        Pick the event categories that fit each of these {len(prompts)} prompts:
+        {numbered}
+
+        Categories: {', '.join(categories)}
+
+        Return a JSON array with one array of category names per prompt, in the same order.
+        Example for two prompts: [["Technical", "Workshop"], ["Sports", "Competition"]]
+        """, len(prompts))
+        picked = [self.taxonomy.validate(reply, allowed=categories) for reply in replies]
+
+        # Second stage only for prompts whose categories have subcategories
+        options = [
+            [tag for category in tags for tag in self.taxonomy.hierarchy[category] if tag in self.vocabulary]
+            for tags in picked
+        ]
+        pending = [i for i, tags in enumerate(options) if tags]
+        if pending:
+            listing = "\n".join(
+                f"{n + 1}. {json.dumps(prompts[i])}\n        Tags: {', '.join(options[i])}"
+                for n, i in enumerate(pending)
+            )
+            replies = self._generate(f"""
+        Pick the specific tags that fit each of these {len(pending)} prompts, using only the tags listed under each prompt:
+        {listing}
+
+        Return a JSON array with one array of tags per prompt, in the same order.
+        Example for two prompts: [["Machine Learning", "Python"], ["Cricket"]]
+        """, len(pending))
+            for i, reply in zip(pending, replies):
+                picked[i] = picked[i] + self.taxonomy.validate(reply, allowed=options[i])
+
+        return [self._with_parents(tags) for tags in picked]
+
+    def _generate(self, prompt: str, expected: int) -> List[list]:
+        """
+        Send a prompt in JSON output mode and check that the reply is an
+        array of `expected` arrays.
+        """
+        model = self._get_model()
+
+        def request():
+            with METRICS.span("gemini.request"):
+                return model.generate_content(prompt, generation_config=JSON_OUTPUT)
+
+        response = self.scheduler.call((self.model_name, prompt), request)
+
+        try:
+            result = json.loads(response.text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Gemini response is not valid JSON: {response.text!r}") from e
+        if not isinstance(result, list) or len(result) != expected or not all(isinstance(tags, list) for tags in result):
+            raise ValueError(f"Expected {expected} tag lists from Gemini, got {result!r}")
+        return result
+
+
+class CachedTagClassifier(TagClassifier):
+    """
+    Wraps another classifier with a TagCache lookup.
+
+    Empty results are not cached so they get retried.
+    """
+
+    def __init__(self, inner: TagClassifier, cache: TagCache):
+        super().__init__(inner.vocabulary, inner.taxonomy)
+        self.inner = inner
+        self.cache = cache
+
+    def classify_batch(self, prompts: Sequence[str]) -> List[List[str]]:
+        version = self.inner.cache_version
+        results: List[Optional[List[str]]] = [self.cache.get(prompt, self.vocabulary, version) for prompt in prompts]
+        missing = [i for i, tags in enumerate(results) if tags is None]
+        METRICS.incr("tag_cache.hits", len(prompts) - len(missing))
+        METRICS.incr("tag_cache.misses", len(missing))
+        if missing:
+            classified = self.inner.classify_batch([prompts[i] for i in missing])
+            for i, tags in zip(missing, classified):
+                results[i] = tags
+                if tags:
+                    self.cache.put(prompts[i], self.vocabulary, tags, version)
+        return results
+
+    def warm_up(self) -> None:
+        self.inner.warm_up()
+
+
+class FallbackTagClassifier(TagClassifier):
+    """
+    Tries the primary classifier and falls back to the secondary one when it
+    raises, e.g. when Gemini is slow, unreachable or rate limited.
+    """
+
+    def __init__(self, primary: TagClassifier, fallback: TagClassifier):
+        super().__init__(primary.vocabulary, primary.taxonomy)
+        self.primary = primary
+        self.fallback = fallback
+
+    def classify_batch(self, prompts: Sequence[str]) -> List[List[str]]:
+        try:
+            return self.primary.classify_batch(prompts)
+        except Exception as e:
+            METRICS.incr("tag_classifier.fallbacks")
+            print(f"Primary tag classifier failed, using fallback: {e}")
+            return self.fallback.classify_batch(prompts)
+
+    def warm_up(self) -> None:
+        self.fallback.warm_up()
+        self.primary.warm_up()
+
+
+def build_classifier(kind: str, cache: Optional[TagCache] = None,
+                     vocabulary: Sequence[str] = TAGS) -> TagClassifier:
+    """
+    Build a classifier by name.
+
+    Args:
+        kind: 'llm' (Gemini only), 'local' (keyword matching only) or
+              'llm_fallback' (Gemini, falling back to keyword matching)
+        cache: Optional TagCache placed in front of the Gemini classifier
+        vocabulary: Tags the classifier may return
+    """
+    kind = kind.lower()
+    if kind == 'local':
+        return LocalTagClassifier(vocabulary)
+
+    llm: TagClassifier = GeminiTagClassifier(vocabulary)
+    if cache is not None:
+        llm = CachedTagClassifier(llm, cache)
+
+    if kind == 'llm':
+        return llm
+    if kind == 'llm_fallback':
+        return FallbackTagClassifier(llm, LocalTagClassifier(vocabulary))
+    raise ValueError(f"Unsupported classifier: {kind}")
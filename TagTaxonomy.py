@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tag_taxonomy.json")
+
+
+class TagTaxonomy:
+    """
+    Two-level tag hierarchy: general categories and their subcategories.
+
+    Precomputes a case-insensitive index from every spelling of a tag to its
+    canonical name and parent, so model replies can be validated and
+    completed with their parent categories in one pass.
+    """
+
+    def __init__(self, hierarchy: Dict[str, Sequence[str]]):
+        """
+        Args:
+            hierarchy: Category name -> list of its subcategory names
+        """
+        self.hierarchy: Dict[str, List[str]] = {category: list(children) for category, children in hierarchy.items()}
+        self.categories: List[str] = list(self.hierarchy)
+        # General categories first, then subcategories grouped by category
+        self.tags: List[str] = self.categories + [tag for children in self.hierarchy.values() for tag in children]
+
+        self.parents: Dict[str, str] = {}
+        for category, children in self.hierarchy.items():
+            for tag in children:
+                if tag in self.parents or tag in self.hierarchy:
+                    raise ValueError(f"Tag {tag!r} appears more than once in the taxonomy")
+                self.parents[tag] = category
+        # Changes whenever a tag is added, removed or moved to another category
+        self.fingerprint = hashlib.sha256(json.dumps(self.hierarchy).encode("utf-8")).hexdigest()[:16]
+        self._index: Dict[str, str] = {self._normalize(tag): tag for tag in self.tags}
+        self._positions: Dict[str, int] = {tag: i for i, tag in enumerate(self.tags)}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "TagTaxonomy":
+        """
+        Load a taxonomy from a JSON file ({category: [subcategories]}),
+        defaulting to TAG_TAXONOMY_PATH or the bundled tag_taxonomy.json.
+        """
+        path = path or os.getenv('TAG_TAXONOMY_PATH', DEFAULT_TAXONOMY_PATH)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _normalize(tag: str) -> str:
+        return " ".join(tag.lower().split())
+
+    def lookup(self, tag) -> Optional[str]:
+        """
+        Canonical name of a tag, or None if it is not in the taxonomy.
+        """
+        return self._index.get(self._normalize(tag)) if isinstance(tag, str) else None
+
+    def validate(self, tags: Iterable, allowed: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Canonicalize tags, drop unknown ones (and those outside `allowed`), add
+        the parent category of every subcategory and return them in taxonomy order.
+        """
+        allowed_set = set(allowed) if allowed is not None else None
+        result = set()
+        for tag in tags:
+            canonical = self.lookup(tag)
+            if canonical is None or (allowed_set is not None and canonical not in allowed_set):
+                continue
+            result.add(canonical)
+            if canonical in self.parents:
+                result.add(self.parents[canonical])
+        return sorted(result, key=self._positions.__getitem__)
@@ -0,0 +1,465 @@
+import importlib.util
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+class VectorBackend:
+    """
+    Storage for student records and their embeddings.
+
+    Records are dicts with an '_id', the 'chunk_text' to embed and flat
+    metadata fields. Search hits are {'_id', '_score', 'fields'} dicts sorted
+    by descending score.
+    """
+
+    def upsert(self, records: List[dict]) -> None:
+        raise NotImplementedError
+
+    def search(self, text: str, top_k: int, metadata_filter: Optional[dict] = None,
+               fields: Optional[List[str]] = None) -> List[dict]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def scan(self, batch_size: int = 100) -> Iterator[List[dict]]:
+        """
+        Yield every stored record, in batches of {'_id', 'fields'} dicts.
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """
+        Open connections ahead of the first request. A no-op by default.
+        """
+
+
+class PineconeBackend(VectorBackend):
+    """
+    Hosted Pinecone index with integrated llama-text-embed-v2 embeddings.
+
+    The client is created on first use (or by warm_up), so constructing the
+    backend does no network I/O.
+    """
+
+    def __init__(self, index_name: str = "", namespace: str = "user_space", index=None):
+        """
+        Args:
+            index_name: Pinecone index to connect to (created if missing)
+            namespace: Namespace holding the student records
+            index: Pre-built index object to use instead of connecting
+        """
+        self.index_name = index_name
+        self.namespace = namespace
+        self._index = index
+        self._connect_lock = threading.Lock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._connect_lock:
+                if self._index is None:
+                    self._index = self._connect(self.index_name)
+        return self._index
+
+    def warm_up(self) -> None:
+        self.index
+
+    @staticmethod
+    def _connect(index_name: str):
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key= os.getenv('PINECONE_API_KEY'))
+        if not pc.has_index(index_name):
+            pc.create_index_for_model(
+                name=index_name,
+                cloud="aws",
+                region="us-east-1",
+                embed={
+                    "model": "llama-text-embed-v2",
+                    "field_map": {"text": "chunk_text"}
+                }
+            )
+
+        return pc.Index(index_name)
+
+    def upsert(self, records: List[dict]) -> None:
+        self.index.upsert_records(self.namespace, records)
+
+    def search(self, text: str, top_k: int, metadata_filter: Optional[dict] = None,
+               fields: Optional[List[str]] = None) -> List[dict]:
+        query = {"inputs": {"text": text}, "top_k": top_k}
+        if metadata_filter:
+            query["filter"] = metadata_filter
+        kwargs = {"fields": fields} if fields is not None else {}
+        response = self.index.search(namespace=self.namespace, query=query, **kwargs)
+        return [
+            {"_id": hit['_id'], "_score": hit['_score'], "fields": dict(hit['fields'])}
+            for hit in response['result']['hits']
+        ]
+
+    def delete(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000], namespace=self.namespace)
+
+    def scan(self, batch_size: int = 100) -> Iterator[List[dict]]:
+        # list() pages through the ids; fetch() returns the stored fields as metadata
+        for ids in self.index.list(namespace=self.namespace, limit=batch_size):
+            vectors = self.index.fetch(ids=list(ids), namespace=self.namespace).vectors
+            yield [
+                {"_id": record_id, "fields": dict(vector.metadata or {})}
+                for record_id, vector in vectors.items()
+            ]
+
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words embedder: every token is hashed to a signed
+    bucket and vectors are L2-normalized. Needs no model download, which makes
+    it suitable for tests, benchmarks and offline use.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"[a-z0-9]+", text.lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbedder:
+    """
+    Embedder backed by a local sentence-transformers model (optional dependency).
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("SentenceTransformerEmbedder requires sentence-transformers "
+                              "(pip install sentence-transformers)") from e
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers/{model_name}"
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(list(texts), normalize_embeddings=True).astype(np.float32)
+
+
+def filter_mask(records: Sequence[dict], metadata_filter: Optional[dict]) -> np.ndarray:
+    """
+    Evaluate a Pinecone-style metadata filter ($eq, $in, $gte, $lte, $and)
+    over record metadata. List fields match $in when any element is allowed.
+    """
+    if not metadata_filter:
+        return np.ones(len(records), dtype=bool)
+    if "$and" in metadata_filter:
+        mask = np.ones(len(records), dtype=bool)
+        for condition in metadata_filter["$and"]:
+            mask &= filter_mask(records, condition)
+        return mask
+
+    (field_name, condition), = metadata_filter.items()
+    values = [record.get(field_name) for record in records]
+    mask = np.ones(len(records), dtype=bool)
+    for op, operand in condition.items():
+        if op in ("$gte", "$lte"):
+            column = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            mask &= column >= operand if op == "$gte" else column <= operand
+        elif op == "$eq":
+            mask &= np.array([v == operand for v in values], dtype=bool)
+        elif op == "$in":
+            allowed = set(operand)
+            mask &= np.array([
+                bool(allowed.intersection(v)) if isinstance(v, list) else v in allowed for v in values
+            ], dtype=bool)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+    return mask
+
+
+def _semester_bounds(metadata_filter: Optional[dict]) -> tuple:
+    """
+    Extract the sem range from a filter so it can be applied on the sem array.
+    """
+    conditions = metadata_filter.get("$and", [metadata_filter]) if metadata_filter else []
+    low, high = -np.inf, np.inf
+    for condition in conditions:
+        sem = condition.get("sem", {})
+        low = max(low, sem.get("$gte", -np.inf))
+        high = min(high, sem.get("$lte", np.inf))
+    return low, high
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    Embedded vector store for single-box deployments.
+
+    Embeddings live in a memory-mapped float32 matrix and metadata in a SQLite
+    side table, both under `path`. Search pre-filters by semester on an
+    in-memory array, applies the remaining filter to the survivors and ranks
+    them by cosine similarity, either exactly or through an IVF index built
+    with build_ivf().
+    """
+
+    def __init__(self, path: str = "vector_store", embedder: Optional[Embedder] = None,
+                 initial_capacity: int = 1024):
+        """
+        Args:
+            path: Directory holding vectors.f32 and metadata.sqlite3
+            embedder: Function mapping texts to L2-normalized float32 vectors
+                      (defaults to HashingEmbedder). Vectors from different
+                      embedders are not comparable, so a store opened with a
+                      different named embedder than it was built with is rejected.
+            initial_capacity: Rows allocated when the store is created
+        """
+        self.path = path
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._check_embedder()
+
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, fields TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._ids: List[str] = []
+        self._fields: List[dict] = []
+        for record_id, fields in self._conn.execute("SELECT id, fields FROM records ORDER BY row"):
+            self._ids.append(record_id)
+            self._fields.append(json.loads(fields))
+        self._rows: Dict[str, int] = {record_id: row for row, record_id in enumerate(self._ids)}
+        self._sem = np.array([fields.get("sem", -1) for fields in self._fields], dtype=np.int16)
+
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        capacity = max(initial_capacity, len(self._ids))
+        if os.path.exists(self._vectors_path):
+            capacity = max(capacity, os.path.getsize(self._vectors_path) // (4 * self.dim))
+        self._open_matrix(capacity)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            if len(ivf["assignments"]) == len(self._ids):
+                self._centroids, self._assignments = ivf["centroids"], ivf["assignments"]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _check_embedder(self) -> None:
+        name = getattr(self.embedder, "name", None)
+        embedder_path = os.path.join(self.path, "embedder.json")
+        if os.path.exists(embedder_path):
+            with open(embedder_path, encoding="utf-8") as f:
+                stored = json.load(f)["name"]
+        elif os.path.exists(os.path.join(self.path, "vectors.f32")):
+            # Stores created before the embedder was recorded used the default
+            stored = HashingEmbedder().name
+        else:
+            stored = None
+        if stored is not None and name is not None and stored != name:
+            raise ValueError(f"Vector store at {self.path} was built with the {stored} embedder, not {name}; "
+                             f"open it with the same embedder (see LOCAL_EMBEDDER) or rebuild it")
+        if stored is None and name is not None:
+            with open(embedder_path, "w", encoding="utf-8") as f:
+                json.dump({"name": name, "dim": self.dim}, f)
+
+    def _open_matrix(self, capacity: int) -> None:
+        size = capacity * self.dim * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._capacity = capacity
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def upsert(self, records: List[dict]) -> None:
+        vectors = self.embedder([record["chunk_text"] for record in records])
+        with self._lock:
+            rows = []
+            for record in records:
+                fields = {key: value for key, value in record.items() if key != "_id"}
+                row = self._rows.get(record["_id"])
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[record["_id"]] = row
+                    self._ids.append(record["_id"])
+                    self._fields.append(fields)
+                else:
+                    self._fields[row] = fields
+                rows.append(row)
+
+            if len(self._ids) > self._capacity:
+                self._matrix.flush()
+                self._open_matrix(max(len(self._ids), self._capacity * 2))
+            self._matrix[rows] = vectors
+            self._matrix.flush()
+
+            sem = np.full(len(self._ids), -1, dtype=np.int16)
+            sem[:len(self._sem)] = self._sem
+            sem[rows] = [self._fields[row].get("sem", -1) for row in rows]
+            self._sem = sem
+
+            if self._centroids is not None:
+                assignments = np.zeros(len(self._ids), dtype=np.int32)
+                assignments[:len(self._assignments)] = self._assignments
+                assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+                self._assignments = assignments
+                # New and re-embedded rows must keep their cluster after a restart
+                self._save_ivf()
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (row, id, fields) VALUES (?, ?, ?)",
+                [(row, self._ids[row], json.dumps(self._fields[row])) for row in rows]
+            )
+            self._conn.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for record_id in ids:
+                row = self._rows.pop(record_id, None)
+                if row is None:
+                    continue
+                # Move the last row into the gap so the matrix stays dense
+                last = len(self._ids) - 1
+                self._conn.execute("DELETE FROM records WHERE row = ?", (row,))
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._ids[row], self._fields[row] = moved_id, self._fields[last]
+                    self._rows[moved_id] = row
+                    self._matrix[row] = self._matrix[last]
+                    self._sem[row] = self._sem[last]
+                    if self._assignments is not None:
+                        self._assignments[row] = self._assignments[last]
+                    self._conn.execute("UPDATE records SET row = ? WHERE row = ?", (row, last))
+                self._ids.pop()
+                self._fields.pop()
+
+            count = len(self._ids)
+            self._sem = self._sem[:count]
+            if self._assignments is not None:
+                self._assignments = self._assignments[:count]
+                self._save_ivf()
+            self._matrix.flush()
+            self._conn.commit()
+
+    def scan(self, batch_size: int = 100) -> Iterator[List[dict]]:
+        with self._lock:
+            records = [{"_id": record_id, "fields": dict(fields)} for record_id, fields in zip(self._ids, self._fields)]
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size]
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """
+        Cluster the stored vectors with spherical k-means so searches only scan
+        the nprobe closest clusters. Worth it from tens of thousands of rows.
+        """
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return
+            n_lists = n_lists or max(1, int(np.sqrt(count)))
+            vectors = np.asarray(self._matrix[:count])
+
+            rng = np.random.default_rng(seed)
+            centroids = vectors[rng.choice(count, size=min(n_lists, count), replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(vectors @ centroids.T, axis=1)
+                for cluster in range(len(centroids)):
+                    members = vectors[assignments == cluster]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+            self._centroids = centroids
+            self._assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+            self._save_ivf()
+
+    def _save_ivf(self) -> None:
+        np.savez(os.path.join(self.path, "ivf.npz"), centroids=self._centroids, assignments=self._assignments)
+
+    def search(self, text: str, top_k: int, metadata_filter: Optional[dict] = None,
+               fields: Optional[List[str]] = None, nprobe: int = 8) -> List[dict]:
+        query = self.embedder([text])[0]
+        with self._lock:
+            count = len(self._ids)
+            low, high = _semester_bounds(metadata_filter)
+            candidates = np.flatnonzero((self._sem[:count] >= low) & (self._sem[:count] <= high))
+
+            if self._centroids is not None and nprobe < len(self._centroids):
+                probed = np.argsort(-(self._centroids @ query))[:nprobe]
+                candidates = candidates[np.isin(self._assignments[candidates], probed)]
+
+            if metadata_filter:
+                candidates = candidates[filter_mask([self._fields[row] for row in candidates], metadata_filter)]
+
+            scores = self._matrix[candidates] @ query
+            top_k = min(top_k, len(candidates))
+            if top_k == 0:
+                return []
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+
+            hits = []
+            for i in best:
+                row = candidates[i]
+                hit_fields = self._fields[row]
+                if fields is not None:
+                    hit_fields = {key: hit_fields[key] for key in fields if key in hit_fields}
+                hits.append({"_id": self._ids[row], "_score": float(scores[i]), "fields": dict(hit_fields)})
+            return hits
+
+
+def build_embedder(kind: Optional[str] = None) -> Embedder:
+    """
+    Build an embedder by name: 'sentence-transformers', 'hashing' or 'auto'
+    (sentence-transformers when installed). Defaults to LOCAL_EMBEDDER or 'auto'.
+    """
+    kind = (kind or os.getenv("LOCAL_EMBEDDER", "auto")).lower()
+    if kind == "auto":
+        if importlib.util.find_spec("sentence_transformers") is not None:
+            kind = "sentence-transformers"
+        else:
+            logging.getLogger('VectorBackend').warning(
+                "sentence-transformers is not installed; the local vector store falls back to the "
+                "bag-of-words HashingEmbedder (pip install sentence-transformers for semantic matching)"
+            )
+            kind = "hashing"
+    if kind == "sentence-transformers":
+        return SentenceTransformerEmbedder(os.getenv("LOCAL_EMBEDDER_MODEL", "all-MiniLM-L6-v2"))
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unsupported embedder: {kind}")
+
+
+def build_backend(kind: str, index_name: str = "", path: Optional[str] = None) -> VectorBackend:
+    """
+    Build a backend by name: 'pinecone' (hosted index) or 'local' (embedded
+    store, embedding with build_embedder()).
+    """
+    kind = kind.lower()
+    if kind == "pinecone":
+        return PineconeBackend(index_name)
+    if kind == "local":
+        return LocalVectorBackend(path or os.getenv("LOCAL_VECTOR_PATH", "vector_store"), embedder=build_embedder())
+    raise ValueError(f"Unsupported vector backend: {kind}")
@@ -1,27 +1,80 @@
 import asyncio
+import logging
+import os
 from datetime import date
 
 import pandas as pd
 import streamlit as st
 from pyparsing import empty
 
+from AudienceTable import AudienceTable
+from DeliveryQueue import DeliveryQueue, DeliveryWorker
+from EventDigest import DigestEvent, EventDigest
+from EventsClient import EventsClient
+from Metrics import METRICS, LoggingSink
 from NotificationHandler import NotificationHandler
 from PineConeHandler import PineConeHandler
 
-try:
-    asyncio.get_running_loop()
-except RuntimeError:
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
 @st.cache_resource
 def load_models():
     """Initialize your models here"""
-    pinecone_handler = PineConeHandler(index_name="")
+    if os.getenv("EVENTS_SERVICE_URL"):
+        # Thin client: matching, registration and delivery run in EventsService
+        client = EventsClient(os.getenv("EVENTS_SERVICE_URL"))
+        return client , None , client
+
+    # Lazy so the first render does not wait on Pinecone and Gemini; both are
+    # connected by a background thread and the status is shown in the header
+    pinecone_handler = PineConeHandler(index_name="", backend=os.getenv("VECTOR_BACKEND", "pinecone"), lazy=True)
+    pinecone_handler.warm_up_in_background()
     notification_handler = NotificationHandler(email = "" , password="")
-    return pinecone_handler , notification_handler
+    delivery_queue = DeliveryQueue(path="delivery_queue.sqlite3")
+    DeliveryWorker(delivery_queue, notification_handler).start()
+
+    # Optional metric sinks; the Performance tab always reads METRICS directly
+    if os.getenv("METRICS_PORT"):
+        METRICS.serve_prometheus(int(os.getenv("METRICS_PORT")))
+    if os.getenv("METRICS_LOG"):
+        METRICS.add_sink(LoggingSink(logging.INFO))
+    return pinecone_handler , notification_handler , delivery_queue
+
+
+@st.fragment(run_every=2)
+def show_delivery_progress(delivery_queue : DeliveryQueue , campaign_id : str):
+    progress = delivery_queue.progress(campaign_id)
+    done = progress["sent"] + progress["failed"]
+    st.progress(done / progress["total"] if progress["total"] else 1.0,
+                text=f"📬 {progress['sent']} sent, {progress['failed']} failed, {progress['pending']} pending")
+    failed = [recipient for recipient, success in delivery_queue.results(campaign_id).items() if not success]
+    if failed:
+        with st.expander(f"Failed recipients ({len(failed)})"):
+            st.write(failed)
+
+
+def show_audience(audience : AudienceTable):
+    # Only the visible page is turned into a table and sent to the browser
+    col1, col2, col3, col4 = st.columns(4)
+    sort_by = col1.selectbox("Sort by", ["score", "username", "branch", "sem", "section"], key="audience_sort")
+    descending = col2.selectbox("Order", ["Descending", "Ascending"],
+                                index=0 if sort_by == "score" else 1, key="audience_order") == "Descending"
+    page_size = col3.selectbox("Rows per page", [25, 50, 100], index=1, key="audience_page_size")
+    page = col4.number_input("Page", min_value=1, max_value=audience.page_count(page_size), value=1,
+                             key="audience_page")
+    st.dataframe(audience.page(page - 1, page_size, sort_by, descending), use_container_width=True,
+                 column_config={"score": st.column_config.NumberColumn("score", format="%.3f")})
 
 
+@st.fragment(run_every=1)
+def show_readiness(pinecone_handler : PineConeHandler):
+    if pinecone_handler.is_ready:
+        return
+    labels = {"vector_store": "Vector store", "classifier": "Tag classifier", "service": "Events service"}
+    icons = {"pending": "⏳", "ready": "✅"}
+    st.caption(" · ".join(
+        f"{icons.get(status, '⚠️')} {labels.get(component, component)}: {status}"
+        for component, status in pinecone_handler.readiness.items()
+    ))
+
 
 def main():
     # Main title
@@ -30,12 +83,18 @@ def main():
 
     if 'students' not in st.session_state:
         st.session_state.students = None
+    if 'campaign_id' not in st.session_state:
+        st.session_state.campaign_id = None
+    if 'digest_campaigns' not in st.session_state:
+        st.session_state.digest_campaigns = []
 
 
-    pinecone_handler , notification_handler = load_models()
+    pinecone_handler , notification_handler , delivery_queue = load_models()
+    show_readiness(pinecone_handler)
 
     # Create tabs
-    tab1, tab2 = st.tabs(["🎯 Event Query Submission", "👥 Student Registration"])
+    tab1, tab2, tab4, tab3 = st.tabs(["🎯 Event Query Submission", "👥 Student Registration", "📰 Event Digest",
+                                      "⚡ Performance"])
 
     # Tab 1: Event Query Submission
     with tab1:
@@ -45,7 +104,8 @@ def main():
 
         with col1:
             event_name = st.text_input("Event Name *", placeholder="Enter event name", key="event_name")
-            event_prompt = st.text_area("Event Description", placeholder="Describe the event", key="event_desc")
+            event_prompt = st.text_area("Event Description", placeholder="Describe the event", key="event_desc",
+                                        help="Personalize with {{ username }}, {{ branch }} or {{ sem }}")
             event_venue = st.text_input("Venue", placeholder="Event location", key="event_venue")
 
         with col2:
@@ -90,24 +150,30 @@ def main():
         if st.button("📤 Submit Event", type="primary", key="submit_event" ,use_container_width=True):
             if event_name and contact_email and event_prompt:
                 ############################################
-                st.session_state.students = pinecone_handler.compare_embeddings(event_prompt=event_prompt , sem_to= semester_to , sem_from=semester_from)
+                st.session_state.students = AudienceTable(asyncio.run(
+                    pinecone_handler.acompare_embeddings(event_prompt=event_prompt , sem_to= semester_to , sem_from=semester_from)
+                ))
                 #############################################
                 st.success("✅ Event submitted successfully!")
             else:
                 st.error("❌ Please fill in at least Event Name and Contact Email")
         if st.session_state.students :
-            st.header("Applicable Students")
-            df = pd.DataFrame(st.session_state.students)
-            st.dataframe(df, use_container_width=True)
-            if st.button("📤 Send Email ", type="primary", key="submit_event" ,use_container_width=True):
-                notification_handler.send_email(
+            st.header(f"Applicable Students ({len(st.session_state.students)})")
+            show_audience(st.session_state.students)
+            if st.button("📤 Send Email ", type="primary", key="send_email" ,use_container_width=True):
+                urls = [{'url': event_url, 'text': 'Register'}] if event_url else []
+                urls += [{'url': url.strip(), 'text': url.strip()} for url in additional_urls.splitlines() if url.strip()]
+                st.session_state.campaign_id = delivery_queue.enqueue(
                     images = uploaded_images ,
                     subject= f"{event_name} happening in your college on {event_date} at {event_venue}" ,
                     text_content=event_prompt ,
-                    urls = event_url ,
-                    recipients= [student['email'] for student in st.session_state.students]
+                    urls = urls ,
+                    recipients= st.session_state.students.emails ,
+                    merge_fields= st.session_state.students.merge_fields()
                 )
-                st.success("✅ Emails sent successfully!")
+                st.success("✅ Emails queued for delivery!")
+            if st.session_state.campaign_id:
+                show_delivery_progress(delivery_queue, st.session_state.campaign_id)
 
     # Tab 2: Student Registration
     with tab2:
@@ -138,7 +204,7 @@ def main():
         if st.button("📝 Register Student", type="primary", key="submit_student" , use_container_width=True):
             if student_name and student_email and student_semester and student_section and user_prompt:
                 #####################################################
-                pinecone_handler.save_embdeddings(
+                asyncio.run(pinecone_handler.asave_embdeddings(
                     user_prompt=user_prompt ,
                     email = student_email ,
                     username=student_name ,
@@ -146,11 +212,66 @@ def main():
                     section=student_section ,
                     branch= student_branch ,
                     mobile_no= student_phone
-                )
+                ))
                 #######################################################
                 st.success("✅ Student registration submitted successfully!")
             else:
                 st.error("❌ Please fill in all required fields (marked with *)")
 
+    # Tab 4: Event Digest
+    with tab4:
+        st.header("📰 Event Digest")
+        st.caption("Match several events at once and send each student a single email listing all of their events.")
+        digest_rows = st.data_editor(
+            pd.DataFrame([{"name": "", "description": "", "details": "", "url": "", "sem_from": 1, "sem_to": 8}]),
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "details": st.column_config.TextColumn("details", help="Date, time and venue"),
+                "sem_from": st.column_config.NumberColumn("sem_from", min_value=1, max_value=8, step=1),
+                "sem_to": st.column_config.NumberColumn("sem_to", min_value=1, max_value=8, step=1)
+            },
+            key="digest_events"
+        )
+        digest_subject = st.text_input("Subject", value="Events picked for you", key="digest_subject")
+        if st.button("📤 Match and Send Digest", type="primary", key="send_digest", use_container_width=True):
+            # Rows added in the editor start with empty (None/NaN) cells
+            rows = [{key: None if pd.isna(value) else value for key, value in row.items()}
+                    for row in digest_rows.to_dict("records")]
+            events = [
+                DigestEvent(name=row["name"], description=row["description"], details=row["details"] or "",
+                            url=row["url"] or None, sem_from=int(row["sem_from"] or 1), sem_to=int(row["sem_to"] or 8))
+                for row in rows if row["name"] and row["description"]
+            ]
+            if events:
+                digest = EventDigest(pinecone_handler)
+                students = digest.match(events)
+                st.session_state.digest_campaigns = digest.enqueue(delivery_queue, events, students, digest_subject)
+                st.success(f"✅ {len(students)} digest emails queued for {len(events)} events")
+            else:
+                st.error("❌ Add at least one event with a name and description")
+        for campaign_id in st.session_state.digest_campaigns:
+            show_delivery_progress(delivery_queue, campaign_id)
+
+    # Tab 3: Performance
+    with tab3:
+        st.header("⚡ Performance")
+        stats = pinecone_handler.stats()
+        snapshot = stats["metrics"]
+        if os.getenv("EVENTS_SERVICE_URL"):
+            st.caption("Measured by the service process that answered this request")
+        if snapshot["timings"]:
+            st.subheader("Latency by stage")
+            timings = pd.DataFrame.from_dict(snapshot["timings"], orient="index").round(1)
+            st.dataframe(timings.sort_values("p95_ms", ascending=False), use_container_width=True)
+        else:
+            st.info("No requests measured yet")
+        if snapshot["counters"]:
+            st.subheader("Counters")
+            st.dataframe(pd.Series(snapshot["counters"], name="value").sort_index(), use_container_width=True)
+        col1, col2 = st.columns(2)
+        col1.metric("Tag cache hit rate", f"{stats['tag_cache']['hit_rate']:.0%}")
+        col2.metric("Audience cache hit rate", f"{stats['audience_cache']['hit_rate']:.0%}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
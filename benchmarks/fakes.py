@@ -0,0 +1,213 @@
+"""
+Local stand-ins for Pinecone, Gemini and an SMTP server, used by the benchmarks.
+"""
+import json
+import re
+import socketserver
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from TagClassifier import LocalTagClassifier
+from VectorBackend import HashingEmbedder, filter_mask
+
+
+class FakeIndex:
+    """
+    In-memory stand-in for a Pinecone Index with integrated embedding.
+
+    Supports upsert_records, search (including top_k, metadata filters
+    ($eq, $in, $gte, $lte, $and) and field projection), list, fetch and
+    delete, and returns responses shaped like the Pinecone SDK's.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        """
+        Args:
+            dim: Embedding dimension
+            latency: Seconds each call sleeps to simulate the network round trip
+        """
+        self.dim = dim
+        self.latency = latency
+        self._embed = HashingEmbedder(dim)
+        self.upsert_calls = 0
+        self.search_calls = 0
+        self._ids: Dict[str, int] = {}
+        self._fields: List[dict] = []
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        # New vectors are appended here and concatenated lazily on search
+        self._pending: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def upsert_records(self, namespace: str, records: List[dict]) -> None:
+        time.sleep(self.latency)
+        vectors = self._embed([record["chunk_text"] for record in records])
+        with self._lock:
+            self.upsert_calls += 1
+            new_rows = []
+            for record, vector in zip(records, vectors):
+                fields = {key: value for key, value in record.items() if key != "_id"}
+                row = self._ids.get(record["_id"])
+                if row is None:
+                    self._ids[record["_id"]] = len(self._fields) + len(new_rows)
+                    new_rows.append((record["_id"], fields, vector))
+                else:
+                    self._fields[row] = dict(fields, _id=record["_id"])
+                    self._matrix()[row] = vector
+            if new_rows:
+                self._fields.extend(dict(fields, _id=record_id) for record_id, fields, _ in new_rows)
+                self._pending.append(np.stack([vector for _, _, vector in new_rows]))
+
+    def _matrix(self) -> np.ndarray:
+        if self._pending:
+            self._vectors = np.concatenate([self._vectors, *self._pending])
+            self._pending = []
+        return self._vectors
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            drop = {self._ids[record_id] for record_id in ids if record_id in self._ids}
+            keep = [row for row in range(len(self._fields)) if row not in drop]
+            self._vectors = self._matrix()[keep]
+            self._fields = [self._fields[row] for row in keep]
+            self._ids = {fields["_id"]: row for row, fields in enumerate(self._fields)}
+
+    def list(self, namespace: str, limit: int = 100):
+        with self._lock:
+            ids = list(self._ids)
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def fetch(self, ids: List[str], namespace: str) -> SimpleNamespace:
+        time.sleep(self.latency)
+        with self._lock:
+            vectors = {
+                record_id: SimpleNamespace(metadata={
+                    key: value for key, value in self._fields[self._ids[record_id]].items() if key != "_id"
+                })
+                for record_id in ids if record_id in self._ids
+            }
+        return SimpleNamespace(vectors=vectors)
+
+    def search(self, namespace: str, query: dict, fields: Optional[List[str]] = None) -> dict:
+        time.sleep(self.latency)
+        with self._lock:
+            self.search_calls += 1
+            vectors, records = self._matrix(), list(self._fields)
+
+        query_vector = self._embed([query["inputs"]["text"]])[0]
+        candidates = np.flatnonzero(filter_mask(records, query.get("filter")))
+        scores = vectors[candidates] @ query_vector
+        top_k = min(query["top_k"], len(candidates))
+        best = np.argpartition(-scores, top_k - 1)[:top_k] if top_k else np.zeros(0, dtype=int)
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        hits = []
+        for i in best:
+            record = records[candidates[i]]
+            hit_fields = {key: value for key, value in record.items() if key != "_id"}
+            if fields is not None:
+                hit_fields = {key: hit_fields[key] for key in fields if key in hit_fields}
+            hits.append({"_id": record["_id"], "_score": float(scores[i]), "fields": hit_fields})
+        return {"result": {"hits": hits}}
+
+
+class StubGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel that answers both stages of the
+    GeminiTagClassifier prompt with the local keyword classifier after a
+    configurable delay.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._classifier = LocalTagClassifier()
+
+    def generate_content(self, prompt: str, generation_config: Optional[dict] = None) -> SimpleNamespace:
+        time.sleep(self.latency)
+        self.calls += 1
+
+        prompts = [json.loads(item) for item in re.findall(r'^\s*\d+\. (".*")\s*$', prompt, re.MULTILINE)]
+        tags = self._classifier.classify_batch(prompts)
+        categories = re.search(r'^\s*Categories: (.*)$', prompt, re.MULTILINE)
+        if categories:
+            allowed = [set(categories.group(1).split(", "))] * len(prompts)
+        else:
+            allowed = [set(line.split(", ")) for line in re.findall(r'^\s*Tags: (.*)$', prompt, re.MULTILINE)]
+        return SimpleNamespace(text=json.dumps([
+            [tag for tag in prompt_tags if tag in prompt_allowed] for prompt_tags, prompt_allowed in zip(tags, allowed)
+        ]))
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        self.wfile.write(b"220 smtp-sink ready\r\n")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    time.sleep(self.server.latency)
+                    self.server.record_message()
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-smtp-sink\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command == b"AUTH":
+                self.wfile.write(b"235 Authentication successful\r\n")
+            elif command == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server that accepts and counts every message.
+    Use NotificationHandler(provider='local', smtp_server=..., smtp_port=...)
+    to send to it.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free port)
+            latency: Seconds to wait before acknowledging each message
+        """
+        super().__init__((host, port), _SMTPSinkHandler)
+        self.latency = latency
+        self.messages = 0
+        self._count_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def record_message(self) -> None:
+        with self._count_lock:
+            self.messages += 1
+
+    def __enter__(self) -> "SMTPSink":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,219 @@
+"""
+Reproducible benchmarks for the registration, matching and mailing hot paths.
+
+Everything runs against local fakes, so no API keys or network are needed:
+
+    python -m benchmarks.run_benchmarks --cohorts 1000,10000,100000 --output bench.json
+
+Results are printed (or written) as JSON so runs can be compared between versions.
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from BulkImporter import BulkImporter
+from Metrics import METRICS
+from NotificationHandler import NotificationHandler
+from PineConeHandler import PineConeHandler
+from TagCache import TagCache
+from TagClassifier import TAGS, CachedTagClassifier, GeminiTagClassifier
+from VectorBackend import LocalVectorBackend, PineconeBackend, VectorBackend
+from benchmarks.fakes import FakeIndex, SMTPSink, StubGenerativeModel
+
+INTERESTS = [
+    "machine learning", "web development", "football", "cricket", "poetry", "photography",
+    "hackathons", "classical music", "dance", "chess", "startups", "robotics", "yoga",
+    "data science", "drama", "painting", "blockchain", "basketball", "creative writing", "career fairs"
+]
+
+
+def synthetic_prompt(rng: random.Random) -> str:
+    return f"I enjoy {', '.join(rng.sample(INTERESTS, 3))} and want to attend {rng.choice(INTERESTS)} events"
+
+
+def make_backend(kind: str, index_latency: float) -> VectorBackend:
+    if kind == "local":
+        return LocalVectorBackend(tempfile.mkdtemp(prefix="bench-vectors-"))
+    return PineconeBackend(index=FakeIndex(latency=index_latency))
+
+
+def make_handler(backend: VectorBackend, llm_latency: float) -> PineConeHandler:
+    cache = TagCache(":memory:")
+    classifier = CachedTagClassifier(GeminiTagClassifier(model=StubGenerativeModel(llm_latency)), cache)
+    return PineConeHandler(index_name="benchmark", tag_cache=cache, classifier=classifier, backend=backend)
+
+
+def seed_cohort(backend: VectorBackend, size: int, rng: random.Random) -> None:
+    batch = []
+    for i in range(size):
+        batch.append({
+            "_id": f"student-{i}",
+            "chunk_text": synthetic_prompt(rng),
+            "email": f"student{i}@college.edu",
+            "username": f"Student {i}",
+            "generation_date": datetime.now().isoformat(),
+            "tags": rng.sample(TAGS, rng.randint(1, 6)),
+            "sem": rng.randint(1, 8),
+            "section": rng.choice("ABCDE"),
+            "mobile_no": "",
+            "branch": rng.choice(["Computer Science", "Electronics", "Mechanical", "Civil"])
+        })
+        if len(batch) == 1000:
+            backend.upsert(batch)
+            batch = []
+    if batch:
+        backend.upsert(batch)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "runs": len(samples)
+    }
+
+
+def bench_save_embeddings(backend_kind: str, registrations: int, llm_latency: float, index_latency: float,
+                          workers: int) -> Dict[str, float]:
+    rng = random.Random(1)
+    rows = [{
+        "user_prompt": synthetic_prompt(rng), "email": f"new{i}@college.edu", "username": f"New {i}",
+        "sem": rng.randint(1, 8), "section": "A", "branch": "Computer Science", "mobile_no": ""
+    } for i in range(registrations)]
+
+    handler = make_handler(make_backend(backend_kind, index_latency), llm_latency)
+    started = time.perf_counter()
+    for row in rows:
+        handler.save_embdeddings(**row)
+    serial = time.perf_counter() - started
+
+    handler = make_handler(make_backend(backend_kind, index_latency), llm_latency)
+    report = BulkImporter(handler, workers=workers).run(rows)
+
+    return {
+        "registrations": registrations,
+        "save_embdeddings_rows_per_s": round(registrations / serial, 2),
+        "bulk_import_rows_per_s": round(report.throughput, 2)
+    }
+
+
+def bench_compare_embeddings(backend_kind: str, cohort: int, queries: int, llm_latency: float,
+                             index_latency: float) -> Dict[str, float]:
+    rng = random.Random(cohort)
+    backend = make_backend(backend_kind, index_latency)
+    seed_cohort(backend, cohort, rng)
+    handler = make_handler(backend, llm_latency)
+
+    cold, warm, audience = [], [], []
+    for _ in range(queries):
+        prompt = synthetic_prompt(rng)
+        sem_from = rng.randint(1, 8)
+        sem_to = rng.randint(sem_from, 8)
+
+        started = time.perf_counter()
+        results = handler.compare_embeddings(prompt, sem_to=sem_to, sem_from=sem_from)
+        cold.append(time.perf_counter() - started)
+        audience.append(len(results))
+
+        started = time.perf_counter()
+        handler.compare_embeddings(prompt, sem_to=sem_to, sem_from=sem_from)
+        warm.append(time.perf_counter() - started)
+
+    return {
+        "cohort": cohort,
+        "cold": percentiles(cold),
+        "cached": percentiles(warm),
+        "mean_audience": round(statistics.mean(audience), 1)
+    }
+
+
+def bench_send_email(recipients: int, concurrency: int, smtp_latency: float) -> Dict[str, float]:
+    logging.getLogger('EmailHandler').setLevel(logging.WARNING)
+    addresses = [f"student{i}@college.edu" for i in range(recipients)]
+    urls = [{'url': 'https://example.com/register', 'text': 'Register'}]
+
+    with SMTPSink(latency=smtp_latency) as sink:
+        host, port = sink.server_address
+        handler = NotificationHandler("events@college.edu", "", provider="local", smtp_server=host, smtp_port=port)
+
+        started = time.perf_counter()
+        handler.send_email(addresses, "Benchmark", "Hello students", urls)
+        serial = time.perf_counter() - started
+        delivered_serial = sink.messages
+
+        started = time.perf_counter()
+        handler.send_bulk_email(addresses, "Benchmark", "Hello students", urls, concurrency=concurrency)
+        bulk = time.perf_counter() - started
+        delivered_bulk = sink.messages - delivered_serial
+
+    return {
+        "recipients": recipients,
+        "send_email_msgs_per_s": round(recipients / serial, 2),
+        "send_bulk_email_msgs_per_s": round(recipients / bulk, 2),
+        "concurrency": concurrency,
+        "send_email_delivered": delivered_serial,
+        "send_bulk_email_delivered": delivered_bulk
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the event matching hot paths against local fakes")
+    parser.add_argument("--backend", default="fake", choices=["fake", "local"],
+                        help="Fake Pinecone index or the embedded LocalVectorBackend")
+    parser.add_argument("--cohorts", default="1000,10000,100000", help="Comma-separated student cohort sizes")
+    parser.add_argument("--queries", type=int, default=20, help="Event matches per cohort")
+    parser.add_argument("--registrations", type=int, default=500)
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub Gemini latency in seconds")
+    parser.add_argument("--index-latency", type=float, default=0.02, help="Fake Pinecone latency in seconds")
+    parser.add_argument("--smtp-latency", type=float, default=0.005, help="SMTP sink per-message latency in seconds")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "save_embdeddings": bench_save_embeddings(args.backend, args.registrations, args.llm_latency,
+                                                  args.index_latency, args.workers),
+        "compare_embeddings": [
+            bench_compare_embeddings(args.backend, int(cohort), args.queries, args.llm_latency, args.index_latency)
+            for cohort in args.cohorts.split(",")
+        ],
+        "send_email": bench_send_email(args.recipients, args.workers, args.smtp_latency),
+        "stages": METRICS.snapshot()
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+import os
+import time
+
+from benchmarks.fakes import SMTPSink
+from DeliveryQueue import DeliveryQueue, DeliveryWorker
+from NotificationHandler import NotificationHandler
+
+
+def test_two_workers_send_each_recipient_once(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    recipients = [f"student{i}@college.edu" for i in range(100)]
+
+    with SMTPSink(latency=0.002) as sink:
+        campaign_id = DeliveryQueue(path).enqueue(recipients, "Tech Fest", "Hello {{ username }}",
+                                                  images=[b"\x89PNG\r\n\x1a\n" + b"0" * 64])
+        workers = [
+            DeliveryWorker(DeliveryQueue(path), NotificationHandler(
+                "events@college.edu", "", provider="local", smtp_server="127.0.0.1", smtp_port=sink.server_address[1]
+            ), batch_size=10, poll_interval=0.1)
+            for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+
+        queue = DeliveryQueue(path)
+        deadline = time.time() + 30
+        while queue.progress(campaign_id)["sent"] < len(recipients) and time.time() < deadline:
+            time.sleep(0.05)
+        for worker in workers:
+            worker.stop()
+            worker.join(5)
+
+        assert queue.progress(campaign_id) == {"pending": 0, "sent": 100, "failed": 0, "total": 100}
+        assert sink.messages == len(recipients)
+        assert not os.path.exists(os.path.join(queue.spool_dir, campaign_id))